@@ -11,6 +11,7 @@ import os
 from datetime import date, datetime, time
 
 import yaml
+from psycopg2.extras import execute_batch
 
 from scripts.grocery_db import GroceryDB
 
@@ -118,6 +119,7 @@ def load_cvs_order_to_database(db: GroceryDB, order_data: dict) -> int:
 
         # Process items from inStore section
         items_loaded = 0
+        item_records = []
         in_store_orders = order_info.get("inStore", [])
 
         for store_order in in_store_orders:
@@ -167,18 +169,19 @@ def load_cvs_order_to_database(db: GroceryDB, order_data: dict) -> int:
                     "raw_data": json.dumps(order_data),
                 }
 
-                # Insert into database
-                columns = list(item_record.keys())
-                placeholders = ", ".join(["%s"] * len(columns))
-                values = [item_record[col] for col in columns]
-
-                insert_sql = f"""
-                    INSERT INTO cvs_purchases ({", ".join(columns)})
-                    VALUES ({placeholders})
-                """
-
-                cur.execute(insert_sql, values)
-                items_loaded += 1
+                item_records.append(item_record)
+
+        # Insert all items in batched round trips
+        if item_records:
+            columns = list(item_records[0].keys())
+            placeholders = ", ".join(["%s"] * len(columns))
+            insert_sql = f"""
+                INSERT INTO cvs_purchases ({", ".join(columns)})
+                VALUES ({placeholders})
+            """
+            rows = [[record[col] for col in columns] for record in item_records]
+            execute_batch(cur, insert_sql, rows, page_size=500)
+            items_loaded = len(rows)
 
         conn.commit()
         return items_loaded
@@ -28,7 +28,7 @@ from datetime import date, datetime, time
 from pathlib import Path
 
 import yaml
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
 # Add scripts directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "scripts"))
@@ -40,6 +40,12 @@ except ImportError:
     # Fallback to src.scripts import (when run from project root)
     from src.scripts.grocery_db import GroceryDB
 
+# Parse with libyaml's C loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
 # Configure logging with bright colors for visibility
 logging.basicConfig(
     level=logging.INFO,
@@ -162,7 +168,7 @@ class OtherPurchasesLoader:
                 logger.error(f"❌ Item {i} missing 'item_name' in {filename}")
                 return False
 
-        logger.info(f"✅ YAML data validation passed for {filename}")
+        logger.debug(f"✅ YAML data validation passed for {filename}")
         return True
 
     def _load_yaml_file(self, file_path: Path) -> dict | None:
@@ -177,13 +183,13 @@ class OtherPurchasesLoader:
         """
         try:
             with open(file_path, encoding="utf-8") as f:
-                data = yaml.safe_load(f)
+                data = yaml.load(f, Loader=YamlLoader)
 
             if not data:
                 logger.error(f"❌ Empty YAML file: {file_path}")
                 return None
 
-            logger.info(f"📄 Loaded YAML file: {file_path}")
+            logger.debug(f"📄 Loaded YAML file: {file_path}")
             return data
 
         except yaml.YAMLError as e:
@@ -193,101 +199,106 @@ class OtherPurchasesLoader:
             logger.error(f"❌ Error loading {file_path}: {e}")
             return None
 
-    def _upsert_purchase_item(
+    # Upsert for a batch of rows; the VALUES list is filled in by execute_values
+    UPSERT_QUERY = """
+        INSERT INTO other_purchases (
+            store_name, item_name, variant, quantity, quantity_unit, price,
+            purchase_date, purchase_time, receipt_source, original_text,
+            raw_data
+        ) VALUES %s
+        ON CONFLICT (store_name, item_name, purchase_date, variant)
+        DO UPDATE SET
+            quantity = EXCLUDED.quantity,
+            quantity_unit = EXCLUDED.quantity_unit,
+            price = EXCLUDED.price,
+            purchase_time = EXCLUDED.purchase_time,
+            receipt_source = EXCLUDED.receipt_source,
+            original_text = EXCLUDED.original_text,
+            raw_data = EXCLUDED.raw_data,
+            updated_at = NOW()
+    """
+
+    def _purchase_row(
         self,
-        cur,
         item_data: dict,
         store_name: str,
         purchase_date: date,
         purchase_time: time,
-        raw_data: dict,
-    ) -> bool:
+        raw_json: str,
+    ) -> tuple:
         """
-        Upsert a single purchase item
+        Build the other_purchases row for a single purchase item
 
         Args:
-            cur: Database cursor
             item_data: Item data from YAML
             store_name: Store name
             purchase_date: Purchase date
             purchase_time: Purchase time
-            raw_data: Complete raw YAML data
+            raw_json: Complete raw YAML data, serialized as JSON
 
         Returns:
-            bool: True if successful
+            Tuple of column values in UPSERT_QUERY order
         """
-        try:
-            # Prepare item data with defaults
-            item_name = item_data["item_name"]
-            variant = item_data.get("variant")
-            quantity = item_data.get("quantity", 1)
-            quantity_unit = item_data.get("quantity_unit")
-            price = item_data.get("price")
-            receipt_source = item_data.get("receipt_source", "manual")
-            original_text = item_data.get("original_text")
-
-            # Convert price to decimal if provided
-            if price is not None:
-                try:
-                    price = float(price)
-                except (ValueError, TypeError):
-                    logger.warning(
-                        f"⚠️  Invalid price '{price}' for item '{item_name}', setting to NULL"
-                    )
-                    price = None
-
-            # Upsert query
-            upsert_query = """
-                INSERT INTO other_purchases (
-                    store_name, item_name, variant, quantity, quantity_unit, price,
-                    purchase_date, purchase_time, receipt_source, original_text,
-                    raw_data
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+        # Prepare item data with defaults
+        item_name = item_data["item_name"]
+        price = item_data.get("price")
+
+        # Convert price to decimal if provided
+        if price is not None:
+            try:
+                price = float(price)
+            except (ValueError, TypeError):
+                logger.warning(
+                    f"⚠️  Invalid price '{price}' for item '{item_name}', setting to NULL"
                 )
-                ON CONFLICT (store_name, item_name, purchase_date, variant)
-                DO UPDATE SET
-                    quantity = EXCLUDED.quantity,
-                    quantity_unit = EXCLUDED.quantity_unit,
-                    price = EXCLUDED.price,
-                    purchase_time = EXCLUDED.purchase_time,
-                    receipt_source = EXCLUDED.receipt_source,
-                    original_text = EXCLUDED.original_text,
-                    raw_data = EXCLUDED.raw_data,
-                    updated_at = NOW()
-            """
-
-            # Execute upsert
-            cur.execute(
-                upsert_query,
-                (
-                    store_name,
-                    item_name,
-                    variant,
-                    quantity,
-                    quantity_unit,
-                    price,
-                    purchase_date,
-                    purchase_time,
-                    receipt_source,
-                    original_text,
-                    json.dumps(raw_data),
-                ),
-            )
-
-            logger.info(f"✅ Upserted item: {item_name} from {store_name}")
-            return True
+                price = None
+
+        return (
+            store_name,
+            item_name,
+            item_data.get("variant"),
+            item_data.get("quantity", 1),
+            item_data.get("quantity_unit"),
+            price,
+            purchase_date,
+            purchase_time,
+            item_data.get("receipt_source", "manual"),
+            item_data.get("original_text"),
+            raw_json,
+        )
+
+    def _upsert_purchase_items(self, cur, rows: list[tuple]) -> int:
+        """
+        Upsert purchase rows in batched multi-row statements
 
-        except Exception as e:
-            logger.error(f"❌ Error upserting item '{item_data.get('item_name', 'unknown')}': {e}")
-            return False
+        Args:
+            cur: Database cursor
+            rows: Rows built by _purchase_row
 
-    def process_yaml_file(self, file_path: Path) -> bool:
+        Returns:
+            int: Number of rows sent to the database
+        """
+        # One statement can't update the same row twice, so when a file repeats an item
+        # keep its last occurrence (what row-by-row upserts ended up storing). Rows with
+        # a NULL variant never conflict and are all kept.
+        unique_rows = {}
+        for i, row in enumerate(rows):
+            store_name, item_name, variant = row[:3]
+            purchase_date = row[6]
+            key = (store_name, item_name, purchase_date, variant) if variant is not None else i
+            unique_rows.pop(key, None)
+            unique_rows[key] = row
+
+        execute_values(cur, self.UPSERT_QUERY, list(unique_rows.values()), page_size=1000)
+        return len(rows)
+
+    def process_yaml_file(self, file_path: Path, conn=None) -> bool:
         """
         Process a single YAML file
 
         Args:
             file_path: Path to YAML file
+            conn: Open database connection to reuse (default: open a new one)
 
         Returns:
             bool: True if successful
@@ -303,7 +314,7 @@ class OtherPurchasesLoader:
         # Parse datetime from filename
         try:
             purchase_date, purchase_time = self._parse_datetime_from_filename(file_path.name)
-            logger.info(f"📅 Purchase date/time: {purchase_date} {purchase_time}")
+            logger.debug(f"📅 Purchase date/time: {purchase_date} {purchase_time}")
         except Exception as e:
             logger.error(f"❌ Error parsing datetime from filename {file_path.name}: {e}")
             return False
@@ -321,21 +332,22 @@ class OtherPurchasesLoader:
         store_name = yaml_data["store_name"]
         items = yaml_data["items"]
 
-        logger.info(f"🏪 Store: {store_name}")
-        logger.info(f"📦 Items to process: {len(items)}")
+        logger.debug(f"🏪 Store: {store_name}")
+        logger.debug(f"📦 Items to process: {len(items)}")
 
-        # Process items
-        conn = self.db.get_connection()
+        # Process items, reusing the caller's connection when given one
+        own_conn = conn is None
+        if own_conn:
+            conn = self.db.get_connection()
         cur = conn.cursor()
 
         try:
-            success_count = 0
-
-            for item in items:
-                if self._upsert_purchase_item(
-                    cur, item, store_name, purchase_date, purchase_time, yaml_data
-                ):
-                    success_count += 1
+            raw_json = json.dumps(yaml_data)
+            rows = [
+                self._purchase_row(item, store_name, purchase_date, purchase_time, raw_json)
+                for item in items
+            ]
+            success_count = self._upsert_purchase_items(cur, rows)
 
             conn.commit()
 
@@ -349,12 +361,15 @@ class OtherPurchasesLoader:
             return success_count == len(items)
 
         except Exception as e:
-            conn.rollback()
+            # A dropped connection can't be rolled back; the caller reconnects instead
+            if not conn.closed:
+                conn.rollback()
             logger.error(f"❌ Database error processing {file_path.name}: {e}")
             return False
         finally:
             cur.close()
-            conn.close()
+            if own_conn:
+                conn.close()
 
     def get_yaml_files(self) -> list[Path]:
         """
@@ -404,18 +419,28 @@ class OtherPurchasesLoader:
             "skipped": 0,
         }
 
-        for file_path in yaml_files:
-            # Skip if already processed (in current session)
-            if str(file_path) in self.processed_files:
-                logger.info(f"⏭️  Skipping already processed file: {file_path.name}")
-                stats["skipped"] += 1
-                continue
+        # One connection for the whole batch; each file still commits on its own
+        conn = self.db.get_connection()
 
-            # Process file
-            if self.process_yaml_file(file_path):
-                stats["processed"] += 1
-            else:
-                stats["failed"] += 1
+        try:
+            for file_path in yaml_files:
+                # Skip if already processed (in current session)
+                if str(file_path) in self.processed_files:
+                    logger.info(f"⏭️  Skipping already processed file: {file_path.name}")
+                    stats["skipped"] += 1
+                    continue
+
+                # Reconnect if a failure closed the connection
+                if conn.closed:
+                    conn = self.db.get_connection()
+
+                # Process file
+                if self.process_yaml_file(file_path, conn):
+                    stats["processed"] += 1
+                else:
+                    stats["failed"] += 1
+        finally:
+            conn.close()
 
         # Log summary
         logger.info("📊 BATCH PROCESSING SUMMARY")
@@ -439,30 +464,24 @@ class OtherPurchasesLoader:
         cur = conn.cursor(cursor_factory=RealDictCursor)
 
         try:
-            # Total records
-            cur.execute("SELECT COUNT(*) as total FROM other_purchases")
-            total_records = cur.fetchone()["total"]
-
-            # Records by store
+            # Records and recent records (last 30 days) by store in one scan; the
+            # totals are the sums over the stores
             cur.execute("""
-                SELECT store_name, COUNT(*) as count
+                SELECT
+                    store_name,
+                    COUNT(*) as count,
+                    COUNT(*) FILTER (
+                        WHERE purchase_date >= CURRENT_DATE - INTERVAL '30 days'
+                    ) as recent
                 FROM other_purchases
                 GROUP BY store_name
                 ORDER BY count DESC
             """)
             stores = cur.fetchall()
 
-            # Recent records (last 30 days)
-            cur.execute("""
-                SELECT COUNT(*) as recent
-                FROM other_purchases
-                WHERE purchase_date >= CURRENT_DATE - INTERVAL '30 days'
-            """)
-            recent_records = cur.fetchone()["recent"]
-
             return {
-                "total_records": total_records,
-                "recent_records": recent_records,
+                "total_records": sum(store["count"] for store in stores),
+                "recent_records": sum(store["recent"] for store in stores),
                 "stores": {store["store_name"]: store["count"] for store in stores},
             }
 
@@ -12,14 +12,18 @@ Usage:
 
 import contextlib
 import json
+import logging
 import os
 import re
 from datetime import date, datetime, time
 
 import yaml
+from psycopg2.extras import execute_batch
 
 from scripts.grocery_db import GroceryDB
 
+logger = logging.getLogger(__name__)
+
 
 class PublixDataProcessor:
     """Processor for Publix raw data to YAML and database."""
@@ -455,7 +459,7 @@ class PublixDataProcessor:
             cashier_name = staff_info.get("cashier")
             supervisor_number = staff_info.get("supervisor")
 
-            items_loaded = 0
+            item_records = []
 
             # Process products from API data
             products = purchase_data.get("products", [])
@@ -489,8 +493,7 @@ class PublixDataProcessor:
                     purchase_data,
                 )
 
-                if self.insert_item_record(cur, item_record):
-                    items_loaded += 1
+                item_records.append(item_record)
 
             # Process receipt items (parsed from receipt text)
             receipt_items = purchase_data.get("receipt_items", [])
@@ -524,8 +527,9 @@ class PublixDataProcessor:
                     purchase_data,
                 )
 
-                if self.insert_item_record(cur, item_record):
-                    items_loaded += 1
+                item_records.append(item_record)
+
+            items_loaded = self.insert_item_records(cur, item_records)
 
             conn.commit()
             return items_loaded
@@ -650,24 +654,32 @@ class PublixDataProcessor:
             "raw_data": json.dumps(raw_data),
         }
 
-    def insert_item_record(self, cur, item_record):
-        """Insert item record into database."""
+    def insert_item_records(self, cur, item_records):
+        """Insert item records into database in batches."""
+        if not item_records:
+            return 0
+
         try:
-            columns = list(item_record.keys())
+            columns = list(item_records[0].keys())
             placeholders = ", ".join(["%s"] * len(columns))
-            values = [item_record[col] for col in columns]
+            rows = [[record[col] for col in columns] for record in item_records]
 
             insert_sql = f"""
                 INSERT INTO publix_purchases ({", ".join(columns)})
                 VALUES ({placeholders})
             """
 
-            cur.execute(insert_sql, values)
-            return True
+            execute_batch(cur, insert_sql, rows, page_size=500)
+            return len(rows)
 
-        except Exception as e:
-            print(f"[ERROR] Failed to insert item record: {e}")
-            return False
+        except Exception:
+            # Let the caller roll back the whole receipt instead of committing part of it
+            logger.exception(
+                "Failed to insert %s item records for receipt %s",
+                len(item_records),
+                item_records[0].get("receipt_id"),
+            )
+            raise
 
 
 if __name__ == "__main__":
@@ -485,40 +485,41 @@ def load_order_to_database(db, order_data):
             "raw_data": order_data.get("raw_data"),
         }
 
-        # Insert each item as a separate row
-        for item in order_data.get("items", []):
-            item_record = common_fields.copy()
-            item_record.update(
-                {
-                    "item_id": item.get("item_id"),
-                    "item_name": item.get("item_name"),
-                    "item_price": item.get("item_price"),
-                    "line_price": item.get("line_price"),
-                    "item_quantity": item.get("item_quantity", 1),
-                    "item_unit_price": item.get("item_unit_price"),
-                    "item_brand": item.get("item_brand"),  # Add missing field
-                    "item_category": item.get("item_category"),  # Add missing field
-                    "item_subcategory": item.get("item_subcategory"),  # Add missing field
-                    "item_sku": item.get("item_sku"),  # Add missing field
-                    "item_upc": item.get("item_upc"),  # Add missing field
-                    "item_image_url": item.get("item_image_url"),
-                    "sales_unit_type": item.get("sales_unit_type"),
-                    # Add other missing fields with defaults
-                    "shipping_total": None,
-                    "tracking_number": None,
-                    "carrier": None,
-                    "delivery_date": None,
-                    "pickup_date": None,
-                    "store_city": None,
-                    "store_state": None,
-                    "store_zip": None,
-                    "payment_method": None,
-                }
-            )
+        # Insert each item as a separate row, committing once per order
+        with db.transaction():
+            for item in order_data.get("items", []):
+                item_record = common_fields.copy()
+                item_record.update(
+                    {
+                        "item_id": item.get("item_id"),
+                        "item_name": item.get("item_name"),
+                        "item_price": item.get("item_price"),
+                        "line_price": item.get("line_price"),
+                        "item_quantity": item.get("item_quantity", 1),
+                        "item_unit_price": item.get("item_unit_price"),
+                        "item_brand": item.get("item_brand"),  # Add missing field
+                        "item_category": item.get("item_category"),  # Add missing field
+                        "item_subcategory": item.get("item_subcategory"),  # Add missing field
+                        "item_sku": item.get("item_sku"),  # Add missing field
+                        "item_upc": item.get("item_upc"),  # Add missing field
+                        "item_image_url": item.get("item_image_url"),
+                        "sales_unit_type": item.get("sales_unit_type"),
+                        # Add other missing fields with defaults
+                        "shipping_total": None,
+                        "tracking_number": None,
+                        "carrier": None,
+                        "delivery_date": None,
+                        "pickup_date": None,
+                        "store_city": None,
+                        "store_state": None,
+                        "store_zip": None,
+                        "payment_method": None,
+                    }
+                )
 
-            record_id = db.insert_walmart_purchase(item_record)
-            if record_id:
-                success_count += 1
+                record_id = db.insert_walmart_purchase(item_record)
+                if record_id:
+                    success_count += 1
 
         return success_count
 
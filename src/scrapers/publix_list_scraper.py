@@ -7,24 +7,72 @@ in the raw/publix directory, organized by purchase date.
 
 Usage:
 1. Update the authentication tokens below
-2. Run: python publix_list_scraper.py
+2. Run: python publix_list_scraper.py [--sqlite raw/publix/purchases.db] [--force]
+
+With --sqlite, each page is also written to a SQLite database in one batched
+transaction, which is much faster to query than thousands of small JSON files.
+Purchases whose JSON file already exists are skipped unless --force is given.
 """
 
-import json
+import argparse
+import contextlib
+import logging
 import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
 
+import orjson
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Disable SSL warnings for this script
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Configure logging (per-purchase lines are DEBUG so large runs stay quiet)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=128)
+def _sanitize_store_name(store_name: str) -> str:
+    """Turn a store name into its filename form (the same few stores repeat)."""
+    return store_name.replace(" ", "-").lower()
+
+
+class RateLimiter:
+    """Thread-safe token bucket that paces requests to stay under Akamai's limits."""
+
+    def __init__(self, requests_per_second: float = 5.0, burst: int = 1):
+        self.rate = requests_per_second
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request token is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.last_refill = time.monotonic()
+                self.tokens = 0.0
+            else:
+                self.tokens -= 1
+
 
 class PublixListScraper:
     """Scraper for Publix purchases list API."""
 
-    def __init__(self):
+    def __init__(self, sqlite_path: str | None = None, force: bool = False):
         # ⚠️ UPDATE THESE VALUES WITH YOUR ACTUAL TOKENS ⚠️
         self.bearer_token = "eyJhbGciOiJSUzI1NiIsImtpZCI6IkwxeE10aHh3aFNMa0VaX2hldV9PNmF6NXF3dTNNbXI2azRDOHhjeHExc1UiLCJ0eXAiOiJKV1QifQ.eyJhdWQiOiI0MmUzZDU3NC00ZDM4LTRkNzMtODhkYS0xYjg5NGFmYjUwY2EiLCJpc3MiOiJodHRwczovL2FjY291bnQucHVibGl4LmNvbS8zNzJjZGU1ZS1lZmEyLTRkYTUtOWI2Mi05ZWU5ZmQ5YzRiYjgvdjIuMC8iLCJleHAiOjE3NTE1NzMyMDgsIm5iZiI6MTc1MTU2OTYwOCwic3ViIjoiNWFlMTNiZjItN2MwMC00MmJkLTg4NTQtMTdlM2Y0MTlmOWYwIiwiT2JqZWN0IEdVSUQiOiI5NTg3M2E1Yy05ZmNmLTRiZGEtYTcyNy03MTY1Nzg0MWMyMjIiLCJwbHMiOjE3NTE1NTY1MDksImVtYWlsIjoicmFtaXJlempvMkBnbWFpbC5jb20iLCJuYW1lIjoiSmVubnkgQ29yb21vdG8gUmFtaXJleiBSb25kb24iLCJnaXZlbl9uYW1lIjoiSmVubnkgQ29yb21vdG8iLCJmYW1pbHlfbmFtZSI6IlJhbWlyZXogUm9uZG9uIiwiaXNGb3Jnb3RQYXNzd29yZCI6ZmFsc2UsIm5vbmNlIjoiNjM4ODcxNjY0MDcwOTYzNDUxLk9ETmtOVFpqWTJZdFlqZGpaUzAwWVdFM0xUaGlOVFl0TjJKaU9HUmhaV1ZpT0dVeE16RXpZVGsxWkdVdFlUSTFaaTAwTm1OaUxXRmpaR1V0Tmpjd1pEaGtPRGcwTVdabSIsInNjcCI6InB1YmxpeC5yZWFkIiwiYXpwIjoiNDJlM2Q1NzQtNGQzOC00ZDczLTg4ZGEtMWI4OTRhZmI1MGNhIiwidmVyIjoiMS4wIiwiaWF0IjoxNzUxNTY5NjA4fQ.KlX2YY9tXlZc4yk94BWu9U1h3N0D2PvttUSIsvItkvpYsxiNg3lmldJZnfuqW9MEg37RWW8Nigesi8xVOY2uhFoDp8HzCr1auk1-pv8bP---69HVeniCfuBulytYojeT7p3QF4hZYcIyORyEMMsbPa_Me9d4_oMRPLQ5R4q-pcTPT5R57AOjVa7eK9m2-NXyy2qcpNtPQyhB_hgmAx_vPl0pQ10ZRi2Wr0eZcv2vxQHbYWJ-FyLGrlYdAIzEgPTBrFRPhGeqENGeJxtUy4pd0xgNzvnEIfY-lNk800IzMMOe85r4d9sw6k8C2MLo6WKdKnpr7HF5o4CFp0-XgUZDyw"  # noqa: S105
         self.ecmsid = "cAKvj8yJFGsQGWEHxIqI5Q=="
@@ -35,9 +83,41 @@ class PublixListScraper:
         self.base_url = "https://services.publix.com/api/v4/customer/publix/purchaseslist"
         self.raw_dir = "raw/publix"
 
+        # Ask for big pages to cut round-trips; halved on page 1 if the API refuses
+        self.items_per_page = 500
+        self.min_items_per_page = 100
+
         # Create raw directory if it doesn't exist
         os.makedirs(self.raw_dir, exist_ok=True)
 
+        # Filenames already on disk (filled per run) so re-runs don't rewrite them
+        self.force = force
+        self._existing: set[str] = set()
+
+        # Background writers so file saves overlap with the next page fetch, and a
+        # single fetcher that downloads page N+1 while page N is being written
+        self.write_pool = ThreadPoolExecutor(max_workers=8)
+        self.fetch_pool = ThreadPoolExecutor(max_workers=1)
+
+        # Optional SQLite sink, written once per page from the main thread
+        self.db: sqlite3.Connection | None = None
+        if sqlite_path:
+            self.db = sqlite3.connect(sqlite_path)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS purchases (
+                    purchase_date TEXT NOT NULL,
+                    store_name TEXT NOT NULL,
+                    total_price REAL NOT NULL,
+                    scraped_at TEXT NOT NULL,
+                    raw BLOB NOT NULL,
+                    UNIQUE (purchase_date, store_name, total_price)
+                )
+                """
+            )
+
         # Request headers
         self.headers = {
             "accept": "application/json, text/plain, */*",
@@ -60,18 +140,49 @@ class PublixListScraper:
             "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
         }
 
-    def parse_purchase_date(self, date_str: str) -> str:
+        # Persistent session so every page reuses the same keep-alive TLS connection.
+        # Headers live on the session so they aren't re-merged on every request.
+        self.session = requests.Session()
+        self.session.verify = False  # Bypass SSL verification
+        self.session.headers.clear()
+        self.session.headers.update(self.headers)
+
+        # Retry transient failures and rate limiting with exponential backoff
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=16))
+
+        # Smooth request bursts so we don't trip the WAF into 429s
+        self.rate = RateLimiter(requests_per_second=5)
+
+    def parse_purchase_date(self, date_str: str | None) -> str:
         """Parse Publix date format to YYYY-MM-DD."""
-        try:
-            # Parse "2025-06-25T21:54:04" format
-            dt = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-            return dt.strftime("%Y-%m-%d")
-        except Exception as e:
-            print(f"[WARNING] Could not parse date {date_str}: {e}")
-            return "unknown-date"
+        # Dates arrive as "2025-06-25T21:54:04", so the day is just the first 10 chars;
+        # PurchaseDate can also be missing or null
+        if (
+            isinstance(date_str, str)
+            and len(date_str) >= 10
+            and date_str[4] == "-"
+            and date_str[7] == "-"
+        ):
+            return date_str[:10]
+        logger.warning("Could not parse date %s", date_str)
+        return "unknown-date"
+
+    def get_purchases_page(self, page: int = 1, items_per_page: int | None = None) -> dict | None:
+        """Get a single page of purchases from Publix API.
+
+        If the first page is rejected as too large (HTTP 400/413), the page size is
+        halved and retried; the accepted size is kept for the remaining pages.
+        """
+        if items_per_page is None:
+            items_per_page = self.items_per_page
 
-    def get_purchases_page(self, page: int = 1, items_per_page: int = 100) -> dict | None:
-        """Get a single page of purchases from Publix API."""
         params = {
             "page": page,
             "itemsPerPage": items_per_page,
@@ -80,25 +191,34 @@ class PublixListScraper:
         }
 
         try:
-            print(f"🔍 Fetching purchases page {page}...")
-            response = requests.get(
-                self.base_url,
-                headers=self.headers,
-                params=params,
-                timeout=30,
-                verify=False,  # Bypass SSL verification
-            )
+            logger.info("🔍 Fetching purchases page %s...", page)
+            self.rate.acquire()
+            response = self.session.get(self.base_url, params=params, timeout=30)
 
             if response.status_code == 200:
-                data = response.json()
-                print(f"✅ Page {page}: Found {len(data.get('PurchasesList', []))} purchases")
+                data = orjson.loads(response.content)
+                logger.info(
+                    "✅ Page %s: Found %s purchases", page, len(data.get("PurchasesList", []))
+                )
+                self.items_per_page = items_per_page
                 return data
-            print(f"❌ Failed to get page {page}: {response.status_code}")
-            print(f"Response: {response.text[:500]}")
+            if (
+                response.status_code in (400, 413)
+                and page == 1
+                and items_per_page // 2 >= self.min_items_per_page
+            ):
+                logger.warning(
+                    "⚠️  Page size %s rejected, retrying with %s",
+                    items_per_page,
+                    items_per_page // 2,
+                )
+                return self.get_purchases_page(page, items_per_page // 2)
+            logger.error("❌ Failed to get page %s: %s", page, response.status_code)
+            logger.error("Response: %s", response.content[:500].decode("utf-8", "replace"))
             return None
 
         except Exception as e:
-            print(f"❌ Error fetching page {page}: {e}")
+            logger.error("❌ Error fetching page %s: %s", page, e)
             return None
 
     def save_purchase_file(self, purchase: dict) -> bool:
@@ -106,11 +226,14 @@ class PublixListScraper:
         try:
             # Parse purchase date for filename
             purchase_date = self.parse_purchase_date(purchase.get("PurchaseDate", ""))
-            store_name = purchase.get("StoreName", "unknown-store").replace(" ", "-").lower()
+            store_name = _sanitize_store_name(purchase.get("StoreName", "unknown-store"))
             total_price = purchase.get("TotalPrice", 0)
 
             # Create filename: YYYY-MM-DD_store-name_$total.json
             filename = f"{purchase_date}_{store_name}_{total_price:.2f}.json"
+            if filename in self._existing:
+                logger.debug("⏭️  Already saved: %s", filename)
+                return True
             filepath = os.path.join(self.raw_dir, filename)
 
             # Add metadata to purchase data
@@ -120,87 +243,189 @@ class PublixListScraper:
                 "purchase": purchase,
             }
 
-            # Save to file
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(purchase_data, f, indent=2, ensure_ascii=False)
-
-            print(f"💾 Saved: {filename}")
+            # Save to file: raw writes to a temp file, then an atomic rename
+            payload = orjson.dumps(purchase_data, option=orjson.OPT_INDENT_2)
+            tmp_path = f"{filepath}.{threading.get_ident()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                try:
+                    # os.write may write less than asked; keep going until it's all out
+                    view = memoryview(payload)
+                    while view:
+                        view = view[os.write(fd, view) :]
+                finally:
+                    os.close(fd)
+                os.replace(tmp_path, filepath)
+            except BaseException:
+                # Don't leave a partial temp file behind
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(tmp_path)
+                raise
+
+            logger.debug("💾 Saved: %s", filename)
             return True
 
         except Exception as e:
-            print(f"❌ Error saving purchase: {e}")
+            logger.error("❌ Error saving purchase: %s", e)
             return False
 
+    def store_purchases_page(self, purchases: list[dict]) -> None:
+        """Write one page of purchases to the SQLite sink in a single transaction."""
+        scraped_at = datetime.now().isoformat()
+        rows = [
+            (
+                self.parse_purchase_date(purchase.get("PurchaseDate", "")),
+                _sanitize_store_name(purchase.get("StoreName", "unknown-store")),
+                purchase.get("TotalPrice", 0),
+                scraped_at,
+                orjson.dumps(purchase),
+            )
+            for purchase in purchases
+        ]
+        # Same identity as the JSON filename, so re-runs replace instead of duplicating
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO purchases "
+                "(purchase_date, store_name, total_price, scraped_at, raw) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _collect_saves(self, page: int, futures: list[Future]) -> int:
+        """Wait for a page's background saves and return how many succeeded."""
+        page_saved = sum(1 for future in as_completed(futures) if future.result())
+        logger.info("   ✅ Saved %s/%s purchases from page %s", page_saved, len(futures), page)
+        return page_saved
+
     def scrape_all_purchases(self) -> None:
         """Scrape all purchases from Publix API and save to files."""
-        print("🏪 PUBLIX PURCHASES LIST SCRAPER")
-        print("=" * 50)
-        print("⚠️  MANUAL SETUP REQUIRED:")
-        print("1. Log into Publix.com")
-        print("2. Go to Purchase History page")
-        print("3. Open Developer Tools (F12)")
-        print("4. Look at Network tab for API calls to /purchaseslist")
-        print("5. Extract from REQUEST HEADERS:")
-        print("   - authorization: Bearer [JWT_TOKEN]")
-        print("   - ecmsid: [SESSION_ID]")
-        print("   - publixstore: [STORE_ID]")
-        print("   - akamai-bm-telemetry: [TELEMETRY_DATA]")
-        print("6. Update this script with your actual values")
-        print()
+        logger.info(
+            "\n".join(
+                [
+                    "🏪 PUBLIX PURCHASES LIST SCRAPER",
+                    "=" * 50,
+                    "⚠️  MANUAL SETUP REQUIRED:",
+                    "1. Log into Publix.com",
+                    "2. Go to Purchase History page",
+                    "3. Open Developer Tools (F12)",
+                    "4. Look at Network tab for API calls to /purchaseslist",
+                    "5. Extract from REQUEST HEADERS:",
+                    "   - authorization: Bearer [JWT_TOKEN]",
+                    "   - ecmsid: [SESSION_ID]",
+                    "   - publixstore: [STORE_ID]",
+                    "   - akamai-bm-telemetry: [TELEMETRY_DATA]",
+                    "6. Update this script with your actual values",
+                    "",
+                ]
+            )
+        )
+
+        # One listdir up front instead of an existence check per purchase
+        self._existing = set() if self.force else set(os.listdir(self.raw_dir))
 
         total_purchases = 0
         saved_purchases = 0
         page = 1
+        total_pages: int | None = None
+        failed_pages: list[int] = []
+        # Saves submitted for the previous page, collected after the next fetch
+        pending: tuple[int, list[Future]] | None = None
+        # Prefetch of the next page, started as soon as the current one arrives
+        next_fetch: Future | None = None
 
-        while True:
-            # Get current page with 100 items
-            page_data = self.get_purchases_page(page, items_per_page=100)
-
-            if not page_data:
-                print(f"❌ Failed to get page {page}, stopping")
-                break
-
-            purchases = page_data.get("PurchasesList", [])
-            total_count = page_data.get("TotalCount", 0)
-            total_pages = page_data.get("TotalPages", 1)
-
-            print(
-                f"📊 Page {page}/{total_pages}: Found {len(purchases)} purchases (Total: {total_count})"
-            )
-
-            if not purchases:
-                print(f"📄 No purchases found on page {page}")
-                break
-
-            # Process each purchase on this page
-            page_saved = 0
-            for purchase in purchases:
-                total_purchases += 1
-                if self.save_purchase_file(purchase):
-                    saved_purchases += 1
-                    page_saved += 1
-
-            print(f"   ✅ Saved {page_saved}/{len(purchases)} purchases from page {page}")
-
-            # Check if this is the last page
-            if page >= total_pages:
-                print(f"📄 Reached last page ({total_pages})")
-                break
-
-            # Continue to next page
-            page += 1
-            print(f"🔄 Moving to page {page}...")
-            print()
-
-        print("\n🎉 SCRAPING COMPLETED!")
-        print("=" * 50)
-        print("📊 SUMMARY:")
-        print(f"   📦 Total purchases found: {total_purchases}")
-        print(f"   💾 Successfully saved: {saved_purchases}")
-        print(f"   ❌ Failed to save: {total_purchases - saved_purchases}")
-        print(f"   📁 Files saved to: {self.raw_dir}")
+        try:
+            while True:
+                # Get current page at the negotiated page size
+                page_data = next_fetch.result() if next_fetch else self.get_purchases_page(page)
+                next_fetch = None
+
+                if pending:
+                    saved_purchases += self._collect_saves(*pending)
+                    pending = None
+
+                if not page_data:
+                    # Once the page count is known, skip past a page that failed its retries
+                    if total_pages is not None and page < total_pages:
+                        logger.error("❌ Failed to get page %s, skipping", page)
+                        failed_pages.append(page)
+                        page += 1
+                        continue
+                    logger.error("❌ Failed to get page %s, stopping", page)
+                    failed_pages.append(page)
+                    break
+
+                purchases = page_data.get("PurchasesList", [])
+                total_count = page_data.get("TotalCount", 0)
+                total_pages = page_data.get("TotalPages", 1)
+
+                logger.info(
+                    "📊 Page %s/%s: Found %s purchases (Total: %s)",
+                    page,
+                    total_pages,
+                    len(purchases),
+                    total_count,
+                )
+
+                if not purchases:
+                    logger.info("📄 No purchases found on page %s", page)
+                    break
+
+                if page < total_pages:
+                    next_fetch = self.fetch_pool.submit(self.get_purchases_page, page + 1)
+
+                # Hand this page's purchases to the writers and move on
+                total_purchases += len(purchases)
+                pending = (
+                    page,
+                    [self.write_pool.submit(self.save_purchase_file, p) for p in purchases],
+                )
+                if self.db:
+                    self.store_purchases_page(purchases)
+
+                # Check if this is the last page
+                if page >= total_pages:
+                    logger.info("📄 Reached last page (%s)", total_pages)
+                    break
+
+                # Continue to next page
+                page += 1
+                logger.info("🔄 Moving to page %s...\n", page)
+
+            if pending:
+                saved_purchases += self._collect_saves(*pending)
+        finally:
+            self.fetch_pool.shutdown(wait=True, cancel_futures=True)
+            self.write_pool.shutdown(wait=True)
+            self.session.close()
+            if self.db:
+                self.db.close()
+
+        logger.info("\n🎉 SCRAPING COMPLETED!")
+        logger.info("=" * 50)
+        logger.info("📊 SUMMARY:")
+        logger.info("   📦 Total purchases found: %s", total_purchases)
+        logger.info("   💾 Successfully saved: %s", saved_purchases)
+        logger.info("   ❌ Failed to save: %s", total_purchases - saved_purchases)
+        logger.info("   📁 Files saved to: %s", self.raw_dir)
+        if failed_pages:
+            logger.info("   ⚠️  Pages that failed to download: %s", failed_pages)
+        if self.db:
+            logger.info("   🗄️  Also stored in SQLite database")
 
 
 if __name__ == "__main__":
-    scraper = PublixListScraper()
+    parser = argparse.ArgumentParser(description="Scrape the Publix purchases list API")
+    parser.add_argument(
+        "--sqlite",
+        metavar="PATH",
+        help="Also store purchases in this SQLite database (one transaction per page)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rewrite purchase files that already exist in raw/publix",
+    )
+    args = parser.parse_args()
+
+    scraper = PublixListScraper(sqlite_path=args.sqlite, force=args.force)
     scraper.scrape_all_purchases()
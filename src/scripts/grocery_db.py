@@ -3,19 +3,617 @@ Database operations for grocery purchase data.
 Handles insertion, updates, and queries for grocery store purchases.
 """
 
-import json
+import csv
+import io
+import logging
 import os
+import re
+import threading
+import weakref
+from contextlib import contextmanager, nullcontext
+from datetime import date, timedelta
+from functools import cache, lru_cache
 
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2 import sql
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+# Full grocery schema, sent to the server as a single multi-statement query
+GROCERY_SCHEMA_DDL = """
+    -- Create grocery_stores table if not exists
+    CREATE TABLE IF NOT EXISTS grocery_stores (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        location TEXT,
+        store_number TEXT,
+        created_at TIMESTAMP DEFAULT NOW(),
+        updated_at TIMESTAMP DEFAULT NOW()
+    );
+
+    -- Create enhanced costco_purchases table if not exists
+    CREATE TABLE IF NOT EXISTS costco_purchases (
+        id SERIAL,
+
+        -- Receipt header info
+        purchase_date DATE NOT NULL,
+        purchase_time TIME,
+        store_location TEXT,
+        receipt_number TEXT,
+
+        -- Item details (one row per item)
+        item_code TEXT,
+        item_name TEXT NOT NULL,
+        item_price DECIMAL(10,2) NOT NULL,
+        item_quantity INTEGER DEFAULT 1,
+        item_unit_price DECIMAL(10,2),
+        tax_indicator TEXT,
+        item_type TEXT,
+        item_department TEXT,
+        discount_reference TEXT,
+        discount_amount DECIMAL(10,2),
+
+        -- Receipt totals
+        subtotal DECIMAL(10,2),
+        tax_total DECIMAL(10,2),
+        total_amount DECIMAL(10,2),
+
+        -- Enhanced Costco fields
+        membership_number TEXT,
+        warehouse_number TEXT,
+        transaction_number TEXT,
+        register_number TEXT,
+        operator_number TEXT,
+        instant_savings DECIMAL(10,2),
+
+        -- Fuel-specific fields
+        fuel_quantity DECIMAL(10,3),
+        fuel_grade TEXT,
+        fuel_unit_price DECIMAL(10,3),
+
+        -- Payment and store info
+        payment_method TEXT,
+        store_address TEXT,
+
+        -- Metadata
+        raw_data JSONB,
+        created_at TIMESTAMP DEFAULT NOW(),
+        updated_at TIMESTAMP DEFAULT NOW(),
+
+        -- Partition key must be part of the primary key
+        PRIMARY KEY (id, purchase_date)
+    ) PARTITION BY RANGE (purchase_date);
+
+    -- Create Walmart purchases table (single table design matching Costco)
+    CREATE TABLE IF NOT EXISTS walmart_purchases (
+        id SERIAL,
+
+        -- Order header info (repeated for each item)
+        order_id TEXT NOT NULL,
+        group_id TEXT,
+        purchase_order_id TEXT,
+        display_id TEXT,
+        purchase_date DATE NOT NULL,
+        purchase_time TIME,
+
+        -- Order details (repeated for each item)
+        order_type TEXT,
+        fulfillment_type TEXT,
+        status_type TEXT,
+        delivery_message TEXT,
+
+        -- Item details (one row per item)
+        item_id TEXT,
+        item_name TEXT NOT NULL,
+        item_price DECIMAL(10,2),
+        line_price DECIMAL(10,2),
+        item_quantity INTEGER DEFAULT 1,
+        item_unit_price DECIMAL(10,2),
+        item_brand TEXT,
+        item_category TEXT,
+        item_subcategory TEXT,
+        item_sku TEXT,
+        item_upc TEXT,
+        item_image_url TEXT,
+        sales_unit_type TEXT,
+
+        -- Store info (repeated for each item)
+        store_id TEXT,
+        store_name TEXT,
+        store_address TEXT,
+        store_city TEXT,
+        store_state TEXT,
+        store_zip TEXT,
+
+        -- Order totals (repeated for each item)
+        subtotal DECIMAL(10,2),
+        tax_total DECIMAL(10,2),
+        shipping_total DECIMAL(10,2),
+        grand_total DECIMAL(10,2),
+
+        -- Payment info (repeated for each item)
+        payment_method TEXT,
+
+        -- Fulfillment details (repeated for each item)
+        tracking_number TEXT,
+        carrier TEXT,
+        delivery_date DATE,
+        pickup_date DATE,
+
+        -- Flags (repeated for each item)
+        is_pet_rx BOOLEAN DEFAULT FALSE,
+        is_active BOOLEAN DEFAULT FALSE,
+        is_shipped_by_walmart BOOLEAN DEFAULT FALSE,
+
+        -- Metadata
+        raw_data JSONB,
+        created_at TIMESTAMP DEFAULT NOW(),
+        updated_at TIMESTAMP DEFAULT NOW(),
+
+        -- Partition key must be part of the primary key
+        PRIMARY KEY (id, purchase_date)
+    ) PARTITION BY RANGE (purchase_date);
+    -- One-time migration for tables created from the old duplicate definition
+    -- (total_amount instead of line_price/grand_total/sales_unit_type):
+    -- ALTER TABLE walmart_purchases
+    -- ADD COLUMN IF NOT EXISTS line_price DECIMAL(10,2),
+    -- ADD COLUMN IF NOT EXISTS grand_total DECIMAL(10,2),
+    -- ADD COLUMN IF NOT EXISTS sales_unit_type TEXT;
+
+    -- Create CVS purchases table (single table design matching Costco/Walmart)
+    CREATE TABLE IF NOT EXISTS cvs_purchases (
+        id SERIAL,
+
+        -- Order header info (repeated for each item)
+        order_number TEXT NOT NULL,
+        order_type TEXT,
+        purchase_date DATE NOT NULL,
+        purchase_time TIME,
+
+        -- Order totals
+        subtotal DECIMAL(10,2),
+        tax_total DECIMAL(10,2),
+        savings_total DECIMAL(10,2),
+        shipping_total DECIMAL(10,2),
+        grand_total DECIMAL(10,2),
+
+        -- Store info
+        store_id TEXT,
+        ec_card TEXT,
+        transaction_number TEXT,
+        register_number TEXT,
+
+        -- Item details
+        item_id TEXT,
+        item_name TEXT NOT NULL,
+        item_size TEXT,
+        item_size_uom TEXT,
+        item_weight TEXT,
+        item_weight_uom TEXT,
+        item_quantity INTEGER DEFAULT 1,
+        item_price_total DECIMAL(10,2),
+        item_price_final DECIMAL(10,2),
+        item_savings DECIMAL(10,2),
+        item_tax DECIMAL(10,2),
+        item_line_total_without_tax DECIMAL(10,2),
+        item_status TEXT,
+        item_image_url TEXT,
+        item_url TEXT,
+        ec_rewards_eligible BOOLEAN DEFAULT FALSE,
+        in_store_only_item BOOLEAN DEFAULT FALSE,
+
+        -- Payment info
+        payment_type TEXT,
+        payment_last_four TEXT,
+        payment_amount_charged DECIMAL(10,2),
+        payment_amount_returned DECIMAL(10,2),
+
+        -- Flags
+        split_shipment BOOLEAN DEFAULT FALSE,
+        split_fulfillment BOOLEAN DEFAULT FALSE,
+        return_eligible BOOLEAN DEFAULT FALSE,
+        return_eligible_final_date DATE,
+
+        -- Metadata
+        raw_data JSONB,
+        created_at TIMESTAMP DEFAULT NOW(),
+        updated_at TIMESTAMP DEFAULT NOW(),
+
+        -- Partition key must be part of the primary key
+        PRIMARY KEY (id, purchase_date)
+    ) PARTITION BY RANGE (purchase_date);
+
+    -- Create Publix purchases table (single table design matching other retailers)
+    CREATE TABLE IF NOT EXISTS publix_purchases (
+        id SERIAL,
+
+        -- Order header info (repeated for each item)
+        transaction_number TEXT NOT NULL,
+        receipt_id TEXT,
+        purchase_date DATE NOT NULL,
+        purchase_time TIME,
+
+        -- Store info
+        store_name TEXT,
+        store_address TEXT,
+        store_manager TEXT,
+        store_phone TEXT,
+
+        -- Order totals
+        order_total DECIMAL(10,2),
+        sales_tax DECIMAL(10,2),
+        grand_total DECIMAL(10,2),
+        vendor_coupon_amount DECIMAL(10,2),
+        store_coupon_amount DECIMAL(10,2),
+        digital_coupon_savings DECIMAL(10,2),
+        total_savings DECIMAL(10,2),
+
+        -- Item details
+        item_id TEXT,
+        item_name TEXT NOT NULL,
+        item_description TEXT,
+        item_quantity INTEGER DEFAULT 1,
+        item_price DECIMAL(10,2),
+        item_size_description TEXT,
+        item_image_url TEXT,
+        item_detail_url TEXT,
+        upc TEXT,
+        base_product_id TEXT,
+        retail_sub_section_number TEXT,
+        activation_status TEXT,
+
+        -- Receipt line item info
+        receipt_line_text TEXT,
+        is_voided_item BOOLEAN DEFAULT FALSE,
+        item_tax_flag VARCHAR(10),  -- T, H, F, etc.
+
+        -- Payment info
+        payment_method TEXT,
+        payment_amount DECIMAL(10,2),
+        payment_account_number TEXT,
+        payment_auth_number TEXT,
+        payment_trace_number TEXT,
+        payment_reference_number TEXT,
+
+        -- FSA info
+        fsa_prescription_amount DECIMAL(10,2),
+        fsa_non_prescription_amount DECIMAL(10,2),
+        fsa_total DECIMAL(10,2),
+
+        -- Staff info
+        cashier_name TEXT,
+        supervisor_number TEXT,
+
+        -- Metadata
+        raw_data JSONB,
+        created_at TIMESTAMP DEFAULT NOW(),
+        updated_at TIMESTAMP DEFAULT NOW(),
+
+        -- Partition key must be part of the primary key
+        PRIMARY KEY (id, purchase_date)
+    ) PARTITION BY RANGE (purchase_date);
+
+    -- Create other_purchases table (generic table for non-main retailers)
+    CREATE TABLE IF NOT EXISTS other_purchases (
+        id SERIAL,
+
+        -- Store and item identification
+        store_name TEXT NOT NULL,
+        item_name TEXT NOT NULL,
+        variant TEXT,
+
+        -- Quantity and pricing
+        quantity INTEGER DEFAULT 1,
+        quantity_unit TEXT,
+        price DECIMAL(10,2),
+
+        -- Purchase details
+        purchase_date DATE NOT NULL,
+        purchase_time TIME,
+
+        -- Receipt source tracking
+        receipt_source TEXT DEFAULT 'manual',  -- 'manual', 'image', 'text'
+        original_text TEXT,
+
+        -- Metadata
+        raw_data JSONB,
+        created_at TIMESTAMP DEFAULT NOW(),
+        updated_at TIMESTAMP DEFAULT NOW(),
+
+        -- Composite unique constraint for upsert logic
+        UNIQUE(store_name, item_name, purchase_date, variant),
+
+        -- Partition key must be part of the primary key
+        PRIMARY KEY (id, purchase_date)
+    ) PARTITION BY RANGE (purchase_date);
+
+    -- Catch-all DEFAULT partition for partitioned purchase tables (tables created
+    -- before partitioning was introduced stay plain tables and are left alone)
+    DO $$
+    DECLARE
+        t text;
+    BEGIN
+        FOREACH t IN ARRAY ARRAY[
+            'costco_purchases', 'walmart_purchases', 'cvs_purchases',
+            'publix_purchases', 'other_purchases'
+        ] LOOP
+            IF (SELECT relkind FROM pg_class WHERE oid = to_regclass(t)) = 'p' THEN
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I DEFAULT', t || '_default', t
+                );
+            END IF;
+        END LOOP;
+    END $$;
+
+    -- Create indexes
+    -- Matches "recent purchases" filters and their ORDER BY, so no sort is needed
+    DROP INDEX IF EXISTS idx_costco_purchase_date;
+
+    CREATE INDEX IF NOT EXISTS idx_costco_date_created
+    ON costco_purchases(purchase_date DESC, created_at DESC);
+
+    CREATE INDEX IF NOT EXISTS idx_costco_store_location
+    ON costco_purchases(store_location);
+
+    CREATE INDEX IF NOT EXISTS idx_costco_item_name
+    ON costco_purchases(item_name);
+
+    -- Receipt drill-down; also serves plain receipt_number lookups
+    DROP INDEX IF EXISTS idx_costco_receipt_number;
+
+    CREATE INDEX IF NOT EXISTS idx_costco_receipt_item
+    ON costco_purchases(receipt_number, item_name);
+
+    -- Create unique constraint to prevent duplicates
+    -- Drop the problematic unique constraint if it exists
+    DROP INDEX IF EXISTS idx_costco_unique_item;
+
+    -- Note: No unique constraint needed - customers can buy:
+    -- - Multiple quantities of same item in one receipt
+    -- - Same item on different dates
+    -- - Same item multiple times in same receipt (separate line items)
+
+    -- Create Walmart indexes
+    DROP INDEX IF EXISTS idx_walmart_purchase_date;
+
+    CREATE INDEX IF NOT EXISTS idx_walmart_date_created
+    ON walmart_purchases(purchase_date DESC, created_at DESC);
+
+    CREATE INDEX IF NOT EXISTS idx_walmart_order_id
+    ON walmart_purchases(order_id);
+
+    CREATE INDEX IF NOT EXISTS idx_walmart_item_name
+    ON walmart_purchases(item_name);
+
+    CREATE INDEX IF NOT EXISTS idx_walmart_store_name
+    ON walmart_purchases(store_name);
+
+    -- Create CVS indexes
+    DROP INDEX IF EXISTS idx_cvs_purchase_date;
+
+    CREATE INDEX IF NOT EXISTS idx_cvs_date_created
+    ON cvs_purchases(purchase_date DESC, created_at DESC);
+
+    CREATE INDEX IF NOT EXISTS idx_cvs_order_number
+    ON cvs_purchases(order_number);
+
+    CREATE INDEX IF NOT EXISTS idx_cvs_item_name
+    ON cvs_purchases(item_name);
+
+    CREATE INDEX IF NOT EXISTS idx_cvs_store_id
+    ON cvs_purchases(store_id);
+
+    -- Create Publix indexes
+    DROP INDEX IF EXISTS idx_publix_purchase_date;
+
+    CREATE INDEX IF NOT EXISTS idx_publix_date_created
+    ON publix_purchases(purchase_date DESC, created_at DESC);
+
+    CREATE INDEX IF NOT EXISTS idx_publix_transaction_number
+    ON publix_purchases(transaction_number);
+
+    CREATE INDEX IF NOT EXISTS idx_publix_item_name
+    ON publix_purchases(item_name);
+
+    CREATE INDEX IF NOT EXISTS idx_publix_store_name
+    ON publix_purchases(store_name);
+
+    -- Create other_purchases indexes
+    DROP INDEX IF EXISTS idx_other_purchase_date;
+
+    CREATE INDEX IF NOT EXISTS idx_other_date_created
+    ON other_purchases(purchase_date DESC, created_at DESC);
+
+    CREATE INDEX IF NOT EXISTS idx_other_store_name
+    ON other_purchases(store_name);
+
+    CREATE INDEX IF NOT EXISTS idx_other_item_name
+    ON other_purchases(item_name);
+
+    CREATE INDEX IF NOT EXISTS idx_other_composite_key
+    ON other_purchases(store_name, item_name, purchase_date);
+
+    -- GIN indexes on raw_data for containment (@>) queries;
+    -- jsonb_path_ops is much smaller than the default jsonb_ops
+    CREATE INDEX IF NOT EXISTS idx_costco_raw_data_gin
+    ON costco_purchases USING GIN (raw_data jsonb_path_ops);
+
+    CREATE INDEX IF NOT EXISTS idx_walmart_raw_data_gin
+    ON walmart_purchases USING GIN (raw_data jsonb_path_ops);
+
+    CREATE INDEX IF NOT EXISTS idx_cvs_raw_data_gin
+    ON cvs_purchases USING GIN (raw_data jsonb_path_ops);
+
+    CREATE INDEX IF NOT EXISTS idx_publix_raw_data_gin
+    ON publix_purchases USING GIN (raw_data jsonb_path_ops);
+
+    CREATE INDEX IF NOT EXISTS idx_other_raw_data_gin
+    ON other_purchases USING GIN (raw_data jsonb_path_ops);
+"""
+
+
+# Connection pools shared by every GroceryDB in the process, keyed by connect settings
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+# Pooled connections that already have the INSERT statements prepared
+_PREPARED_CONNS = weakref.WeakSet()
+
 
 class GroceryDB:
     """Database handler for grocery purchase data."""
 
+    # Batches larger than this are streamed with COPY instead of multi-VALUES INSERT
+    COPY_THRESHOLD = 1000
+
+    # Insert column order for the batch (multi-VALUES / COPY) paths
+    COSTCO_COLUMNS = (
+        "purchase_date",
+        "purchase_time",
+        "store_location",
+        "receipt_number",
+        "item_code",
+        "item_name",
+        "item_price",
+        "item_quantity",
+        "item_unit_price",
+        "tax_indicator",
+        "item_type",
+        "item_department",
+        "discount_reference",
+        "discount_amount",
+        "subtotal",
+        "tax_total",
+        "total_amount",
+        "membership_number",
+        "warehouse_number",
+        "transaction_number",
+        "register_number",
+        "operator_number",
+        "instant_savings",
+        "fuel_quantity",
+        "fuel_grade",
+        "fuel_unit_price",
+        "payment_method",
+        "store_address",
+        "raw_data",
+    )
+
+    WALMART_COLUMNS = (
+        "order_id",
+        "group_id",
+        "purchase_order_id",
+        "display_id",
+        "purchase_date",
+        "purchase_time",
+        "order_type",
+        "fulfillment_type",
+        "status_type",
+        "delivery_message",
+        "item_id",
+        "item_name",
+        "item_price",
+        "line_price",
+        "item_quantity",
+        "item_unit_price",
+        "item_brand",
+        "item_category",
+        "item_subcategory",
+        "item_sku",
+        "item_upc",
+        "item_image_url",
+        "sales_unit_type",
+        "store_id",
+        "store_name",
+        "store_address",
+        "store_city",
+        "store_state",
+        "store_zip",
+        "subtotal",
+        "tax_total",
+        "shipping_total",
+        "grand_total",
+        "payment_method",
+        "tracking_number",
+        "carrier",
+        "delivery_date",
+        "pickup_date",
+        "is_pet_rx",
+        "is_active",
+        "is_shipped_by_walmart",
+        "raw_data",
+    )
+
+    # Relations ensure_grocery_tables creates, and indexes it drops; used to skip
+    # the DDL entirely when the schema is already up to date
+    SCHEMA_RELATIONS = (
+        "grocery_stores",
+        "costco_purchases",
+        "walmart_purchases",
+        "cvs_purchases",
+        "publix_purchases",
+        "other_purchases",
+        "idx_costco_date_created",
+        "idx_costco_store_location",
+        "idx_costco_item_name",
+        "idx_costco_receipt_item",
+        "idx_walmart_date_created",
+        "idx_walmart_order_id",
+        "idx_walmart_item_name",
+        "idx_walmart_store_name",
+        "idx_cvs_date_created",
+        "idx_cvs_order_number",
+        "idx_cvs_item_name",
+        "idx_cvs_store_id",
+        "idx_publix_date_created",
+        "idx_publix_transaction_number",
+        "idx_publix_item_name",
+        "idx_publix_store_name",
+        "idx_other_date_created",
+        "idx_other_store_name",
+        "idx_other_item_name",
+        "idx_other_composite_key",
+        "idx_costco_raw_data_gin",
+        "idx_walmart_raw_data_gin",
+        "idx_cvs_raw_data_gin",
+        "idx_publix_raw_data_gin",
+        "idx_other_raw_data_gin",
+    )
+
+    OBSOLETE_INDEXES = (
+        "idx_costco_purchase_date",
+        "idx_costco_receipt_number",
+        "idx_costco_unique_item",
+        "idx_walmart_purchase_date",
+        "idx_cvs_purchase_date",
+        "idx_publix_purchase_date",
+        "idx_other_purchase_date",
+    )
+
+    # Purchase tables that are range-partitioned by purchase_date on fresh installs,
+    # and how many months ahead of the current one to keep partitions ready
+    PARTITIONED_TABLES = (
+        "costco_purchases",
+        "walmart_purchases",
+        "cvs_purchases",
+        "publix_purchases",
+        "other_purchases",
+    )
+    PARTITION_MONTHS_AHEAD = 2
+
+    # Server-side prepared single-row INSERTs: statement name -> (table, columns)
+    PREPARED_INSERTS = {
+        "costco_insert": ("costco_purchases", COSTCO_COLUMNS),
+        "walmart_insert": ("walmart_purchases", WALMART_COLUMNS),
+    }
+
     def __init__(self):
         # Get database configuration from environment variables
         self.db_config = {
@@ -33,570 +631,281 @@ class GroceryDB:
         else:
             self.database_url = None
 
+        # Connect arguments, decided once: DATABASE_URL wins over the individual settings
+        self._connect_kwargs = (
+            {"dsn": self.database_url} if self.database_url else dict(self.db_config)
+        )
+
+        # Key into the process-wide pools, so repeated GroceryDB() calls share one pool
+        self._pool_key = tuple(sorted(self._connect_kwargs.items()))
+
+        # Per-thread connection of an open transaction() block, if any
+        self._local = threading.local()
+
     def get_connection(self):
         """Get database connection."""
         try:
-            if self.database_url:
-                # Use DATABASE_URL if provided
-                return psycopg2.connect(self.database_url)
-            # Use individual config parameters
-            return psycopg2.connect(**self.db_config)
+            return psycopg2.connect(**self._connect_kwargs)
         except Exception as e:
-            print(f"[ERROR] Database connection failed: {e}")
-            print("[ERROR] Check your .env file and database configuration")
+            logger.error("Database connection failed: %s", e)
+            logger.error("Check your .env file and database configuration")
             raise
 
-    def ensure_grocery_tables(self):
-        """Ensure grocery tables exist and create indexes."""
-        conn = self.get_connection()
-        cur = conn.cursor()
+    def _get_pool(self):
+        """
+        Get (creating on first call) the process-wide connection pool.
 
-        try:
-            # Create grocery_stores table if not exists
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS grocery_stores (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(50) NOT NULL,
-                    location VARCHAR(200),
-                    store_number VARCHAR(50),
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-
-            # Create enhanced costco_purchases table if not exists
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS costco_purchases (
-                    id SERIAL PRIMARY KEY,
-
-                    -- Receipt header info
-                    purchase_date DATE NOT NULL,
-                    purchase_time TIME,
-                    store_location VARCHAR(200),
-                    receipt_number VARCHAR(50),
-
-                    -- Item details (one row per item)
-                    item_code VARCHAR(20),
-                    item_name VARCHAR(300) NOT NULL,
-                    item_price DECIMAL(10,2) NOT NULL,
-                    item_quantity INTEGER DEFAULT 1,
-                    item_unit_price DECIMAL(10,2),
-                    tax_indicator VARCHAR(10),
-                    item_type VARCHAR(50),
-                    item_department VARCHAR(20),
-                    discount_reference VARCHAR(20),
-                    discount_amount DECIMAL(10,2),
-
-                    -- Receipt totals
-                    subtotal DECIMAL(10,2),
-                    tax_total DECIMAL(10,2),
-                    total_amount DECIMAL(10,2),
-
-                    -- Enhanced Costco fields
-                    membership_number VARCHAR(20),
-                    warehouse_number VARCHAR(10),
-                    transaction_number VARCHAR(20),
-                    register_number VARCHAR(10),
-                    operator_number VARCHAR(10),
-                    instant_savings DECIMAL(10,2),
-
-                    -- Fuel-specific fields
-                    fuel_quantity DECIMAL(10,3),
-                    fuel_grade VARCHAR(50),
-                    fuel_unit_price DECIMAL(10,3),
-
-                    -- Payment and store info
-                    payment_method VARCHAR(100),
-                    store_address VARCHAR(300),
-
-                    -- Metadata
-                    raw_data JSONB,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-
-            # Create Walmart purchases table (single table design matching Costco)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS walmart_purchases (
-                    id SERIAL PRIMARY KEY,
-
-                    -- Order header info (repeated for each item)
-                    order_id VARCHAR(50) NOT NULL,
-                    group_id VARCHAR(50),
-                    purchase_order_id VARCHAR(50),
-                    display_id VARCHAR(50),
-                    purchase_date DATE NOT NULL,
-                    purchase_time TIME,
-
-                    -- Order details (repeated for each item)
-                    order_type VARCHAR(50),
-                    fulfillment_type VARCHAR(50),
-                    status_type VARCHAR(50),
-                    delivery_message VARCHAR(200),
-
-                    -- Item details (one row per item)
-                    item_id VARCHAR(50),
-                    item_name VARCHAR(300) NOT NULL,
-                    item_price DECIMAL(10,2),
-                    line_price DECIMAL(10,2),
-                    item_quantity INTEGER DEFAULT 1,
-                    item_unit_price DECIMAL(10,2),
-                    item_brand VARCHAR(200),
-                    item_category VARCHAR(100),
-                    item_subcategory VARCHAR(100),
-                    item_sku VARCHAR(50),
-                    item_upc VARCHAR(50),
-                    item_image_url VARCHAR(500),
-                    sales_unit_type VARCHAR(50),
-
-                    -- Store info (repeated for each item)
-                    store_id VARCHAR(20),
-                    store_name VARCHAR(200),
-                    store_address VARCHAR(300),
-                    store_city VARCHAR(100),
-                    store_state VARCHAR(10),
-                    store_zip VARCHAR(20),
-
-                    -- Order totals (repeated for each item)
-                    subtotal DECIMAL(10,2),
-                    tax_total DECIMAL(10,2),
-                    shipping_total DECIMAL(10,2),
-                    grand_total DECIMAL(10,2),
-
-                    -- Payment info (repeated for each item)
-                    payment_method VARCHAR(100),
-
-                    -- Fulfillment details (repeated for each item)
-                    tracking_number VARCHAR(100),
-                    carrier VARCHAR(50),
-                    delivery_date DATE,
-                    pickup_date DATE,
-
-                    -- Flags (repeated for each item)
-                    is_pet_rx BOOLEAN DEFAULT FALSE,
-                    is_active BOOLEAN DEFAULT FALSE,
-                    is_shipped_by_walmart BOOLEAN DEFAULT FALSE,
-
-                    -- Metadata
-                    raw_data JSONB,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS walmart_purchases (
-                    id SERIAL PRIMARY KEY,
-
-                    -- Order header info
-                    order_id VARCHAR(50) NOT NULL,
-                    group_id VARCHAR(50),
-                    purchase_order_id VARCHAR(50),
-                    display_id VARCHAR(50),
-                    purchase_date DATE NOT NULL,
-                    purchase_time TIME,
-
-                    -- Order details
-                    order_type VARCHAR(50),
-                    fulfillment_type VARCHAR(50),
-                    status_type VARCHAR(50),
-                    delivery_message VARCHAR(200),
-
-                    -- Item details
-                    item_id VARCHAR(50),
-                    item_name VARCHAR(300) NOT NULL,
-                    item_price DECIMAL(10,2),
-                    item_quantity INTEGER DEFAULT 1,
-                    item_unit_price DECIMAL(10,2),
-                    item_brand VARCHAR(200),
-                    item_category VARCHAR(100),
-                    item_subcategory VARCHAR(100),
-                    item_sku VARCHAR(50),
-                    item_upc VARCHAR(50),
-                    item_image_url VARCHAR(500),
-
-                    -- Store info
-                    store_id VARCHAR(20),
-                    store_name VARCHAR(200),
-                    store_address VARCHAR(300),
-                    store_city VARCHAR(100),
-                    store_state VARCHAR(10),
-                    store_zip VARCHAR(20),
-
-                    -- Pricing and totals
-                    subtotal DECIMAL(10,2),
-                    tax_total DECIMAL(10,2),
-                    shipping_total DECIMAL(10,2),
-                    total_amount DECIMAL(10,2),
-
-                    -- Payment info
-                    payment_method VARCHAR(100),
-
-                    -- Fulfillment details
-                    tracking_number VARCHAR(100),
-                    carrier VARCHAR(50),
-                    delivery_date DATE,
-                    pickup_date DATE,
-
-                    -- Flags
-                    is_pet_rx BOOLEAN DEFAULT FALSE,
-                    is_active BOOLEAN DEFAULT FALSE,
-                    is_shipped_by_walmart BOOLEAN DEFAULT FALSE,
-
-                    -- Metadata
-                    raw_data JSONB,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-
-            # Create CVS purchases table (single table design matching Costco/Walmart)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS cvs_purchases (
-                    id SERIAL PRIMARY KEY,
-
-                    -- Order header info (repeated for each item)
-                    order_number VARCHAR(50) NOT NULL,
-                    order_type VARCHAR(50),
-                    purchase_date DATE NOT NULL,
-                    purchase_time TIME,
-
-                    -- Order totals
-                    subtotal DECIMAL(10,2),
-                    tax_total DECIMAL(10,2),
-                    savings_total DECIMAL(10,2),
-                    shipping_total DECIMAL(10,2),
-                    grand_total DECIMAL(10,2),
-
-                    -- Store info
-                    store_id VARCHAR(20),
-                    ec_card VARCHAR(20),
-                    transaction_number VARCHAR(20),
-                    register_number VARCHAR(20),
-
-                    -- Item details
-                    item_id VARCHAR(50),
-                    item_name VARCHAR(300) NOT NULL,
-                    item_size VARCHAR(50),
-                    item_size_uom VARCHAR(20),
-                    item_weight VARCHAR(50),
-                    item_weight_uom VARCHAR(20),
-                    item_quantity INTEGER DEFAULT 1,
-                    item_price_total DECIMAL(10,2),
-                    item_price_final DECIMAL(10,2),
-                    item_savings DECIMAL(10,2),
-                    item_tax DECIMAL(10,2),
-                    item_line_total_without_tax DECIMAL(10,2),
-                    item_status VARCHAR(50),
-                    item_image_url VARCHAR(500),
-                    item_url VARCHAR(500),
-                    ec_rewards_eligible BOOLEAN DEFAULT FALSE,
-                    in_store_only_item BOOLEAN DEFAULT FALSE,
-
-                    -- Payment info
-                    payment_type VARCHAR(50),
-                    payment_last_four VARCHAR(10),
-                    payment_amount_charged DECIMAL(10,2),
-                    payment_amount_returned DECIMAL(10,2),
-
-                    -- Flags
-                    split_shipment BOOLEAN DEFAULT FALSE,
-                    split_fulfillment BOOLEAN DEFAULT FALSE,
-                    return_eligible BOOLEAN DEFAULT FALSE,
-                    return_eligible_final_date DATE,
-
-                    -- Metadata
-                    raw_data JSONB,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-
-            # Create Publix purchases table (single table design matching other retailers)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS publix_purchases (
-                    id SERIAL PRIMARY KEY,
-
-                    -- Order header info (repeated for each item)
-                    transaction_number VARCHAR(100) NOT NULL,
-                    receipt_id VARCHAR(200),
-                    purchase_date DATE NOT NULL,
-                    purchase_time TIME,
-
-                    -- Store info
-                    store_name VARCHAR(100),
-                    store_address VARCHAR(200),
-                    store_manager VARCHAR(100),
-                    store_phone VARCHAR(20),
-
-                    -- Order totals
-                    order_total DECIMAL(10,2),
-                    sales_tax DECIMAL(10,2),
-                    grand_total DECIMAL(10,2),
-                    vendor_coupon_amount DECIMAL(10,2),
-                    store_coupon_amount DECIMAL(10,2),
-                    digital_coupon_savings DECIMAL(10,2),
-                    total_savings DECIMAL(10,2),
-
-                    -- Item details
-                    item_id VARCHAR(100),
-                    item_name VARCHAR(300) NOT NULL,
-                    item_description VARCHAR(500),
-                    item_quantity INTEGER DEFAULT 1,
-                    item_price DECIMAL(10,2),
-                    item_size_description VARCHAR(100),
-                    item_image_url VARCHAR(500),
-                    item_detail_url VARCHAR(500),
-                    upc VARCHAR(100),
-                    base_product_id VARCHAR(200),
-                    retail_sub_section_number VARCHAR(50),
-                    activation_status VARCHAR(10),
-
-                    -- Receipt line item info
-                    receipt_line_text VARCHAR(500),
-                    is_voided_item BOOLEAN DEFAULT FALSE,
-                    item_tax_flag VARCHAR(10),  -- T, H, F, etc.
-
-                    -- Payment info
-                    payment_method VARCHAR(100),
-                    payment_amount DECIMAL(10,2),
-                    payment_account_number VARCHAR(100),
-                    payment_auth_number VARCHAR(100),
-                    payment_trace_number VARCHAR(100),
-                    payment_reference_number VARCHAR(100),
-
-                    -- FSA info
-                    fsa_prescription_amount DECIMAL(10,2),
-                    fsa_non_prescription_amount DECIMAL(10,2),
-                    fsa_total DECIMAL(10,2),
-
-                    -- Staff info
-                    cashier_name VARCHAR(100),
-                    supervisor_number VARCHAR(20),
-
-                    -- Metadata
-                    raw_data JSONB,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-
-            # Create other_purchases table (generic table for non-main retailers)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS other_purchases (
-                    id SERIAL PRIMARY KEY,
-
-                    -- Store and item identification
-                    store_name VARCHAR(200) NOT NULL,
-                    item_name VARCHAR(300) NOT NULL,
-                    variant VARCHAR(200),
-
-                    -- Quantity and pricing
-                    quantity INTEGER DEFAULT 1,
-                    quantity_unit VARCHAR(50),
-                    price DECIMAL(10,2),
-
-                    -- Purchase details
-                    purchase_date DATE NOT NULL,
-                    purchase_time TIME,
-
-                    -- Receipt source tracking
-                    receipt_source VARCHAR(50) DEFAULT 'manual',  -- 'manual', 'image', 'text'
-                    original_text TEXT,
-
-                    -- Metadata
-                    raw_data JSONB,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW(),
-
-                    -- Composite unique constraint for upsert logic
-                    UNIQUE(store_name, item_name, purchase_date, variant)
-                );
-            """)
-
-            # Create indexes
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_costco_purchase_date
-                ON costco_purchases(purchase_date);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_costco_store_location
-                ON costco_purchases(store_location);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_costco_item_name
-                ON costco_purchases(item_name);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_costco_receipt_number
-                ON costco_purchases(receipt_number);
-            """)
-
-            # Create unique constraint to prevent duplicates
-            # Drop the problematic unique constraint if it exists
-            cur.execute("""
-                DROP INDEX IF EXISTS idx_costco_unique_item;
-            """)
-
-            # Note: No unique constraint needed - customers can buy:
-            # - Multiple quantities of same item in one receipt
-            # - Same item on different dates
-            # - Same item multiple times in same receipt (separate line items)
-
-            # Create Walmart indexes
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_walmart_purchase_date
-                ON walmart_purchases(purchase_date);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_walmart_order_id
-                ON walmart_purchases(order_id);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_walmart_item_name
-                ON walmart_purchases(item_name);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_walmart_store_name
-                ON walmart_purchases(store_name);
-            """)
-
-            # Create CVS indexes
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_cvs_purchase_date
-                ON cvs_purchases(purchase_date);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_cvs_order_number
-                ON cvs_purchases(order_number);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_cvs_item_name
-                ON cvs_purchases(item_name);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_cvs_store_id
-                ON cvs_purchases(store_id);
-            """)
-
-            # Create Publix indexes
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_publix_purchase_date
-                ON publix_purchases(purchase_date);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_publix_transaction_number
-                ON publix_purchases(transaction_number);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_publix_item_name
-                ON publix_purchases(item_name);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_publix_store_name
-                ON publix_purchases(store_name);
-            """)
-
-            # Create other_purchases indexes
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_other_purchase_date
-                ON other_purchases(purchase_date);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_other_store_name
-                ON other_purchases(store_name);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_other_item_name
-                ON other_purchases(item_name);
-            """)
-
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_other_composite_key
-                ON other_purchases(store_name, item_name, purchase_date);
-            """)
-
-            conn.commit()
-            print("[✓] Grocery database tables and indexes ensured")
+        The pool is created on first use so constructing GroceryDB never connects.
+        """
+        pool = _POOLS.get(self._pool_key)
+        if pool is None:
+            with _POOLS_LOCK:
+                pool = _POOLS.get(self._pool_key)
+                if pool is None:
+                    try:
+                        pool = ThreadedConnectionPool(2, 10, **self._connect_kwargs)
+                    except Exception as e:
+                        logger.error("Database connection failed: %s", e)
+                        logger.error("Check your .env file and database configuration")
+                        raise
+                    _POOLS[self._pool_key] = pool
+        return pool
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection from the pool for the duration of a with block.
 
-        except Exception as e:
-            conn.rollback()
-            print(f"[ERROR] Failed to ensure grocery tables: {e}")
-            raise
+        The connection goes back to the pool afterwards (rolled back if a
+        transaction was left open) instead of being closed.
+
+        Yields:
+            connection: psycopg2 connection
+        """
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
         finally:
-            cur.close()
-            conn.close()
+            pool.putconn(conn)
 
-    def insert_costco_purchase(self, purchase_data):
+    @contextmanager
+    def transaction(self):
         """
-        Insert a single Costco purchase record.
+        Group single-row inserts into one transaction, committed at the end of the block.
+
+        insert_costco_purchase/insert_walmart_purchase calls made inside the block
+        (on the same thread) share its connection and commit once instead of per
+        row. Each row runs in its own savepoint, so a bad row is skipped without
+        losing the others. Nested blocks join the outer transaction.
+
+        Yields:
+            connection: psycopg2 connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        with self.connection() as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._local.conn = None
+
+    def close(self):
+        """Close every pooled connection (shared with other GroceryDB instances)."""
+        with _POOLS_LOCK:
+            pool = _POOLS.pop(self._pool_key, None)
+        if pool is not None:
+            pool.closeall()
+
+    def _schema_is_current(self, cur):
+        """
+        Check the catalog once for every expected table/index and no obsolete ones.
 
         Args:
-            purchase_data (dict): Purchase data with keys matching table columns
+            cur: Open database cursor
 
         Returns:
-            int: ID of inserted record, or None if failed
+            bool: True if ensure_grocery_tables has nothing to do
         """
-        conn = self.get_connection()
-        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT c.relname
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relname = ANY(%s)
+            """,
+            (list(self.SCHEMA_RELATIONS + self.OBSOLETE_INDEXES),),
+        )
+        existing = {row[0] for row in cur.fetchall()}
+        return existing.issuperset(self.SCHEMA_RELATIONS) and existing.isdisjoint(
+            self.OBSOLETE_INDEXES
+        )
+
+    def _ensure_monthly_partitions(self, cur):
+        """
+        Create missing monthly partitions for the partitioned purchase tables.
 
-        try:
-            # Enhanced insert query with all new fields
-            insert_query = """
-                INSERT INTO costco_purchases (
-                    purchase_date, purchase_time, store_location, receipt_number,
-                    item_code, item_name, item_price, item_quantity, item_unit_price,
-                    tax_indicator, item_type, item_department, discount_reference,
-                    discount_amount, subtotal, tax_total, total_amount,
-                    membership_number, warehouse_number, transaction_number,
-                    register_number, operator_number, instant_savings,
-                    fuel_quantity, fuel_grade, fuel_unit_price,
-                    payment_method, store_address, raw_data
-                ) VALUES (
-                    %(purchase_date)s, %(purchase_time)s, %(store_location)s, %(receipt_number)s,
-                    %(item_code)s, %(item_name)s, %(item_price)s, %(item_quantity)s, %(item_unit_price)s,
-                    %(tax_indicator)s, %(item_type)s, %(item_department)s, %(discount_reference)s,
-                    %(discount_amount)s, %(subtotal)s, %(tax_total)s, %(total_amount)s,
-                    %(membership_number)s, %(warehouse_number)s, %(transaction_number)s,
-                    %(register_number)s, %(operator_number)s, %(instant_savings)s,
-                    %(fuel_quantity)s, %(fuel_grade)s, %(fuel_unit_price)s,
-                    %(payment_method)s, %(store_address)s, %(raw_data)s
-                ) RETURNING id;
+        Partitions are kept for this month plus PARTITION_MONTHS_AHEAD, and for every
+        month that has rows in a table's DEFAULT partition (historical loads land
+        there); those rows are moved into their month so date filters can prune them.
+
+        Only applies to purchase tables that are actually partitioned; tables
+        created before partitioning was introduced are plain tables and skipped.
+        Converting one is a manual rebuild (see docs/DATABASE_SCHEMA.md).
+
+        Args:
+            cur: Open database cursor
+        """
+        month_start = date.today().replace(day=1)
+        upcoming = []
+        for _ in range(self.PARTITION_MONTHS_AHEAD + 1):
+            upcoming.append(month_start)
+            month_start = (month_start + timedelta(days=32)).replace(day=1)
+
+        cur.execute(
+            """
+            SELECT c.relname
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relname = ANY(%s) AND c.relkind = 'p'
+            """,
+            (list(self.PARTITIONED_TABLES),),
+        )
+        partitioned = [row[0] for row in cur.fetchall()]
+        if not partitioned:
+            return
+
+        cur.execute(
             """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = ANY(%s::regclass[])
+            """,
+            (partitioned,),
+        )
+        existing = {row[0] for row in cur.fetchall()}
+
+        for table_name in partitioned:
+            default_name = f"{table_name}_default"
+            backfill = set()
+            if default_name in existing:
+                cur.execute(
+                    sql.SQL(
+                        "SELECT DISTINCT date_trunc('month', purchase_date)::date FROM {}"
+                    ).format(sql.Identifier(default_name))
+                )
+                backfill = {row[0] for row in cur.fetchall()}
+
+            for start in sorted(backfill.union(upcoming)):
+                partition_name = f"{table_name}_{start:%Y_%m}"
+                if partition_name not in existing:
+                    self._create_month_partition(
+                        cur,
+                        table_name,
+                        partition_name,
+                        start,
+                        default_name if start in backfill else None,
+                    )
+
+    def _create_month_partition(self, cur, table_name, partition_name, start, default_name):
+        """
+        Create one monthly partition, moving its rows out of the DEFAULT partition.
 
-            # Convert raw_data to JSON string if it's a dict
-            if isinstance(purchase_data.get("raw_data"), dict):
-                purchase_data["raw_data"] = json.dumps(purchase_data["raw_data"])
+        Args:
+            cur: Open database cursor
+            table_name (str): Partitioned purchase table
+            partition_name (str): Name of the new partition
+            start (date): First day of the month
+            default_name (str): DEFAULT partition holding rows for this month, or None
+        """
+        end = (start + timedelta(days=32)).replace(day=1)
+        table = sql.Identifier(table_name)
+        partition = sql.Identifier(partition_name)
 
-            # Execute the query
-            cur.execute(insert_query, purchase_data)
-            record_id = cur.fetchone()[0]
+        # One failed month shouldn't fail the whole schema check
+        cur.execute("SAVEPOINT create_partition")
+        try:
+            if default_name is None:
+                cur.execute(
+                    sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+                        partition, table
+                    ),
+                    (start, end),
+                )
+            else:
+                # PARTITION OF is refused while DEFAULT holds rows in the range, so
+                # build the partition standalone, move the rows over, then attach it
+                cur.execute(
+                    sql.SQL(
+                        "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                    ).format(partition, table)
+                )
+                cur.execute(
+                    sql.SQL(
+                        "WITH moved AS ("
+                        "DELETE FROM {} WHERE purchase_date >= %s AND purchase_date < %s "
+                        "RETURNING *) "
+                        "INSERT INTO {} SELECT * FROM moved"
+                    ).format(sql.Identifier(default_name), partition),
+                    (start, end),
+                )
+                moved = cur.rowcount
+                cur.execute(
+                    sql.SQL(
+                        "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)"
+                    ).format(table, partition),
+                    (start, end),
+                )
+                logger.info("Moved %s rows from %s to %s", moved, default_name, partition_name)
+            cur.execute("RELEASE SAVEPOINT create_partition")
+            logger.info("Created partition %s", partition_name)
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT create_partition")
+            logger.warning("Could not create partition %s: %s", partition_name, e)
 
-            conn.commit()
-            return record_id
+    def ensure_grocery_tables(self):
+        """Ensure grocery tables exist and create indexes."""
+        with self.connection() as conn, conn.cursor() as cur:
+            try:
+                # Fast path: skip the DDL (and its locks) when nothing is missing
+                if self._schema_is_current(cur):
+                    self._ensure_monthly_partitions(cur)
+                    conn.commit()
+                    logger.info("Grocery database tables and indexes ensured")
+                    return
 
-        except Exception as e:
-            conn.rollback()
-            print(f"[ERROR] Failed to insert Costco purchase: {e}")
-            print(f"[DEBUG] Purchase data keys: {list(purchase_data.keys())}")
-            return None
-        finally:
-            cur.close()
-            conn.close()
+                # All tables and indexes in one round-trip
+                cur.execute(GROCERY_SCHEMA_DDL)
+                self._ensure_monthly_partitions(cur)
+
+                conn.commit()
+                logger.info("Grocery database tables and indexes ensured")
+
+            except Exception:
+                conn.rollback()
+                logger.exception("Failed to ensure grocery tables")
+                raise
+
+    def insert_costco_purchase(self, purchase_data):
+        """
+        Insert a single Costco purchase record.
+
+        Args:
+            purchase_data (dict): Purchase data with keys matching table columns
+
+        Returns:
+            int: ID of inserted record, or None if failed
+        """
+        return self._insert_prepared("costco_insert", purchase_data, "Costco")
 
     def insert_costco_purchases_batch(self, purchases_list):
         """
@@ -608,22 +917,9 @@ class GroceryDB:
         Returns:
             tuple: (success_count, error_count)
         """
-        success_count = 0
-        error_count = 0
-
-        for purchase in purchases_list:
-            try:
-                record_id = self.insert_costco_purchase(purchase)
-                if record_id:
-                    success_count += 1
-                else:
-                    error_count += 1
-            except Exception as e:
-                print(f"[ERROR] Batch insert error for purchase: {e}")
-                error_count += 1
-
-        print(f"[✓] Batch insert completed: {success_count} success, {error_count} errors")
-        return success_count, error_count
+        return self._batch_insert(
+            "costco_purchases", self.COSTCO_COLUMNS, purchases_list, self.insert_costco_purchase
+        )
 
     def insert_walmart_purchase(self, purchase_data):
         """
@@ -635,85 +931,250 @@ class GroceryDB:
         Returns:
             int: Record ID if successful, None if failed
         """
-        conn = self.get_connection()
-        cur = conn.cursor()
+        return self._insert_prepared("walmart_insert", purchase_data, "Walmart")
 
-        try:
-            insert_query = """
-                INSERT INTO walmart_purchases (
-                    order_id, group_id, purchase_order_id, display_id,
-                    purchase_date, purchase_time, order_type, fulfillment_type,
-                    status_type, delivery_message, item_id, item_name,
-                    item_price, line_price, item_quantity, item_unit_price,
-                    item_brand, item_category, item_subcategory, item_sku,
-                    item_upc, item_image_url, sales_unit_type, store_id,
-                    store_name, store_address, store_city, store_state,
-                    store_zip, subtotal, tax_total, shipping_total,
-                    grand_total, payment_method, tracking_number, carrier,
-                    delivery_date, pickup_date, is_pet_rx, is_active,
-                    is_shipped_by_walmart, raw_data
-                ) VALUES (
-                    %(order_id)s, %(group_id)s, %(purchase_order_id)s, %(display_id)s,
-                    %(purchase_date)s, %(purchase_time)s, %(order_type)s, %(fulfillment_type)s,
-                    %(status_type)s, %(delivery_message)s, %(item_id)s, %(item_name)s,
-                    %(item_price)s, %(line_price)s, %(item_quantity)s, %(item_unit_price)s,
-                    %(item_brand)s, %(item_category)s, %(item_subcategory)s, %(item_sku)s,
-                    %(item_upc)s, %(item_image_url)s, %(sales_unit_type)s, %(store_id)s,
-                    %(store_name)s, %(store_address)s, %(store_city)s, %(store_state)s,
-                    %(store_zip)s, %(subtotal)s, %(tax_total)s, %(shipping_total)s,
-                    %(grand_total)s, %(payment_method)s, %(tracking_number)s, %(carrier)s,
-                    %(delivery_date)s, %(pickup_date)s, %(is_pet_rx)s, %(is_active)s,
-                    %(is_shipped_by_walmart)s, %(raw_data)s
-                ) RETURNING id;
-            """
+    def batch_insert_walmart_purchases(self, purchases_list):
+        """
+        Insert multiple Walmart purchases in batch.
+
+        Args:
+            purchases_list (list): List of purchase data dictionaries
+
+        Returns:
+            tuple: (success_count, error_count)
+        """
+        return self._batch_insert(
+            "walmart_purchases", self.WALMART_COLUMNS, purchases_list, self.insert_walmart_purchase
+        )
 
-            # Convert raw_data to JSON string if it's a dict
-            if isinstance(purchase_data.get("raw_data"), dict):
-                purchase_data["raw_data"] = json.dumps(purchase_data["raw_data"])
+    def _purchase_row(self, columns, purchase_data):
+        """
+        Pull a purchase's values out in column order (missing keys become NULL).
 
-            # Execute the query
-            cur.execute(insert_query, purchase_data)
-            record_id = cur.fetchone()[0]
+        Args:
+            columns (tuple): Column names, in insert order
+            purchase_data (dict): Purchase data dictionary
 
-            conn.commit()
-            return record_id
+        Returns:
+            list: Column values, with a dict raw_data wrapped for JSONB adaptation
+        """
+        row = [purchase_data.get(column) for column in columns]
+        # Let psycopg2 adapt raw_data (always the last column) without touching the
+        # caller's dict
+        if isinstance(row[-1], dict | list):
+            row[-1] = Json(row[-1])
+        return row
+
+    @staticmethod
+    @cache
+    def _insert_target(table_name, columns):
+        """
+        Compose (once per table) the quoted "table (col, ...)" target of an INSERT/COPY.
 
-        except Exception as e:
-            conn.rollback()
-            print(f"[ERROR] Failed to insert Walmart purchase: {e}")
-            print(f"[DEBUG] Purchase data keys: {list(purchase_data.keys())}")
-            return None
-        finally:
-            cur.close()
-            conn.close()
+        Args:
+            table_name (str): Purchase table name
+            columns (tuple): Column names from the class column registry
 
-    def batch_insert_walmart_purchases(self, purchases_list):
+        Returns:
+            sql.Composed: Reusable SQL fragment
         """
-        Insert multiple Walmart purchases in batch.
+        return sql.SQL("{} ({})").format(
+            sql.Identifier(table_name), sql.SQL(", ").join(map(sql.Identifier, columns))
+        )
+
+    @staticmethod
+    @cache
+    def _values_template(column_count):
+        """
+        Build (once per width) the execute_values row template "(%s, %s, ...)".
+
+        Args:
+            column_count (int): Number of columns in the registry
+
+        Returns:
+            str: Row template
+        """
+        return "(" + ", ".join(["%s"] * column_count) + ")"
+
+    def _prepare_inserts(self, conn, cur):
+        """
+        PREPARE the single-row INSERT statements once per pooled connection.
 
         Args:
+            conn: Pooled connection the statements belong to
+            cur: Cursor on that connection
+        """
+        if conn in _PREPARED_CONNS:
+            return
+
+        # Start clean in case an earlier attempt on this connection half-finished, dropping
+        # only our own statements so anything else prepared on the connection is left alone
+        cur.execute(
+            "SELECT name FROM pg_prepared_statements WHERE name = ANY(%s)",
+            (list(self.PREPARED_INSERTS),),
+        )
+        for (name,) in cur.fetchall():
+            cur.execute(sql.SQL("DEALLOCATE {}").format(sql.Identifier(name)))
+        for name, (table_name, columns) in self.PREPARED_INSERTS.items():
+            params = sql.SQL(", ").join(sql.SQL(f"${i}") for i in range(1, len(columns) + 1))
+            cur.execute(
+                sql.SQL("PREPARE {} AS INSERT INTO {} VALUES ({}) RETURNING id").format(
+                    sql.Identifier(name), self._insert_target(table_name, columns), params
+                )
+            )
+        _PREPARED_CONNS.add(conn)
+
+    def _insert_prepared(self, statement_name, purchase_data, retailer):
+        """
+        Insert one purchase through a server-side prepared statement.
+
+        Args:
+            statement_name (str): Key in PREPARED_INSERTS
+            purchase_data (dict): Purchase data with keys matching table columns
+            retailer (str): Retailer name for error messages
+
+        Returns:
+            int: ID of inserted record, or None if failed
+        """
+        _, columns = self.PREPARED_INSERTS[statement_name]
+        placeholders = ", ".join(["%s"] * len(columns))
+
+        tx_conn = getattr(self._local, "conn", None)
+
+        with (
+            nullcontext(tx_conn) if tx_conn is not None else self.connection() as conn,
+            conn.cursor() as cur,
+        ):
+            try:
+                if tx_conn is not None:
+                    cur.execute("SAVEPOINT purchase_insert")
+                self._prepare_inserts(conn, cur)
+                cur.execute(
+                    f"EXECUTE {statement_name} ({placeholders})",
+                    self._purchase_row(columns, purchase_data),
+                )
+                record_id = cur.fetchone()[0]
+
+                # Inside transaction() the block commits once at the end
+                if tx_conn is not None:
+                    cur.execute("RELEASE SAVEPOINT purchase_insert")
+                else:
+                    conn.commit()
+                return record_id
+
+            except Exception:
+                if tx_conn is not None:
+                    cur.execute("ROLLBACK TO SAVEPOINT purchase_insert")
+                else:
+                    conn.rollback()
+                # Re-prepare next time rather than trust this connection's state
+                _PREPARED_CONNS.discard(conn)
+                logger.exception("Failed to insert %s purchase", retailer)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Purchase data keys: %s", list(purchase_data.keys()))
+                return None
+
+    def _batch_insert(self, table_name, columns, purchases_list, insert_one):
+        """
+        Insert purchases with a single multi-VALUES statement in one transaction.
+
+        Batches larger than COPY_THRESHOLD are streamed with COPY instead, which
+        skips per-row SQL parsing entirely. If the batch is rejected (e.g. one
+        malformed row), falls back to inserting row by row so the good rows still
+        make it in.
+
+        Args:
+            table_name (str): Purchase table to insert into
+            columns (tuple): Column names, in insert order
             purchases_list (list): List of purchase data dictionaries
+            insert_one (callable): Single-row inserter used for the fallback
 
         Returns:
             tuple: (success_count, error_count)
         """
-        success_count = 0
-        error_count = 0
+        if not purchases_list:
+            return 0, 0
+
+        rows = [self._purchase_row(columns, purchase) for purchase in purchases_list]
 
-        for purchase in purchases_list:
+        insert_query = sql.SQL("INSERT INTO {} VALUES %s RETURNING id").format(
+            self._insert_target(table_name, columns)
+        )
+
+        with self.connection() as conn, conn.cursor() as cur:
             try:
-                record_id = self.insert_walmart_purchase(purchase)
-                if record_id:
-                    success_count += 1
+                if len(rows) > self.COPY_THRESHOLD:
+                    self._copy_rows(cur, table_name, columns, rows)
+                    success_count = len(rows)
                 else:
-                    error_count += 1
-            except Exception as e:
-                print(f"[ERROR] Batch insert error for purchase: {e}")
-                error_count += 1
+                    # One statement for the whole batch (it is at most COPY_THRESHOLD
+                    # rows); RETURNING gives back the ids of the inserted rows
+                    inserted = execute_values(
+                        cur,
+                        insert_query,
+                        rows,
+                        template=self._values_template(len(columns)),
+                        page_size=self.COPY_THRESHOLD,
+                        fetch=True,
+                    )
+                    success_count = len(inserted)
+                conn.commit()
+                error_count = len(purchases_list) - success_count
 
-        print(f"[✓] Batch insert completed: {success_count} success, {error_count} errors")
+            except Exception as e:
+                conn.rollback()
+                logger.warning(
+                    "Batch insert into %s failed, retrying row by row: %s", table_name, e
+                )
+                success_count = 0
+                error_count = 0
+                with self.transaction():
+                    for purchase in purchases_list:
+                        if insert_one(purchase):
+                            success_count += 1
+                        else:
+                            error_count += 1
+
+        logger.info(
+            "Batch insert into %s completed: %s success, %s errors",
+            table_name,
+            success_count,
+            error_count,
+        )
         return success_count, error_count
 
+    def _copy_rows(self, cur, table_name, columns, rows):
+        """
+        Stream rows into a table with COPY ... FROM STDIN using an in-memory CSV.
+
+        Args:
+            cur: Open database cursor
+            table_name (str): Table to copy into
+            columns (tuple): Column names, in row order
+            rows (list): Row value lists (None becomes NULL)
+        """
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        for row in rows:
+            writer.writerow([self._copy_value(value) for value in row])
+        buf.seek(0)
+
+        cur.copy_expert(
+            sql.SQL("COPY {} FROM STDIN WITH (FORMAT csv, NULL '\\N')").format(
+                self._insert_target(table_name, columns)
+            ),
+            buf,
+        )
+
+    @staticmethod
+    def _copy_value(value):
+        """Render one value for the COPY CSV stream (NULL as \\N, Json as JSON text)."""
+        if value is None:
+            return "\\N"
+        if isinstance(value, Json):
+            return value.dumps(value.adapted)
+        return value
+
     def get_table_count(self, table_name):
         """
         Get the total number of records in a specific table.
@@ -725,9 +1186,6 @@ class GroceryDB:
             int: Number of records in the table, or -1 if error
         """
         try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-
             # Use parameterized query safely for table name
             # Note: Table names cannot be parameterized, so we validate the name
             valid_tables = [
@@ -742,16 +1200,12 @@ class GroceryDB:
                 raise ValueError(f"Invalid table name: {table_name}")
 
             query = f"SELECT COUNT(*) FROM {table_name}"
-            cur.execute(query)
-            count = cur.fetchone()[0]
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(query)
+                return cur.fetchone()[0]
 
-            cur.close()
-            conn.close()
-
-            return count
-
-        except Exception as e:
-            print(f"[ERROR] Failed to count records in {table_name}: {e}")
+        except Exception:
+            logger.exception("Failed to count records in %s", table_name)
             return -1
 
     def get_recent_costco_purchases(self, days_back=30):
@@ -764,41 +1218,33 @@ class GroceryDB:
         Returns:
             list: List of purchase records
         """
-        conn = self.get_connection()
-        cur = conn.cursor()
-
-        try:
-            query = """
-                SELECT * FROM costco_purchases
-                WHERE purchase_date >= CURRENT_DATE - INTERVAL '%s days'
-                ORDER BY purchase_date DESC, created_at DESC;
-            """
-
-            cur.execute(query, (days_back,))
-            columns = [desc[0] for desc in cur.description]
-            results = []
-
-            for row in cur.fetchall():
-                record = dict(zip(columns, row, strict=False))
-                # Convert date/time objects to strings for JSON serialization
-                if record.get("purchase_date"):
-                    record["purchase_date"] = record["purchase_date"].isoformat()
-                if record.get("purchase_time"):
-                    record["purchase_time"] = str(record["purchase_time"])
-                if record.get("created_at"):
-                    record["created_at"] = record["created_at"].isoformat()
-                if record.get("updated_at"):
-                    record["updated_at"] = record["updated_at"].isoformat()
-                results.append(record)
-
-            return results
-
-        except Exception as e:
-            print(f"[ERROR] Failed to get recent purchases: {e}")
-            return []
-        finally:
-            cur.close()
-            conn.close()
+        with self.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            try:
+                query = """
+                    SELECT * FROM costco_purchases
+                    WHERE purchase_date >= CURRENT_DATE - make_interval(days => %s)
+                    ORDER BY purchase_date DESC, created_at DESC;
+                """
+
+                cur.execute(query, (days_back,))
+                results = cur.fetchall()
+
+                for record in results:
+                    # Convert date/time objects to strings for JSON serialization
+                    if record.get("purchase_date"):
+                        record["purchase_date"] = record["purchase_date"].isoformat()
+                    if record.get("purchase_time"):
+                        record["purchase_time"] = str(record["purchase_time"])
+                    if record.get("created_at"):
+                        record["created_at"] = record["created_at"].isoformat()
+                    if record.get("updated_at"):
+                        record["updated_at"] = record["updated_at"].isoformat()
+
+                return results
+
+            except Exception:
+                logger.exception("Failed to get recent purchases")
+                return []
 
     def get_costco_purchase_summary(self, days_back=30):
         """
@@ -810,43 +1256,42 @@ class GroceryDB:
         Returns:
             dict: Summary statistics
         """
-        conn = self.get_connection()
-        cur = conn.cursor()
-
-        try:
-            query = """
-                SELECT
-                    COUNT(*) as total_items,
-                    COUNT(DISTINCT receipt_number) as total_receipts,
-                    COUNT(DISTINCT purchase_date) as shopping_days,
-                    SUM(item_price) as total_spent,
-                    AVG(item_price) as avg_item_price,
-                    MIN(purchase_date) as earliest_purchase,
-                    MAX(purchase_date) as latest_purchase
-                FROM costco_purchases
-                WHERE purchase_date >= CURRENT_DATE - INTERVAL '%s days';
-            """
+        with self.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            try:
+                query = """
+                    SELECT
+                        COUNT(*) as total_items,
+                        COUNT(DISTINCT receipt_number) as total_receipts,
+                        COUNT(DISTINCT purchase_date) as shopping_days,
+                        SUM(item_price) as total_spent,
+                        AVG(item_price) as avg_item_price,
+                        to_char(MIN(purchase_date), 'YYYY-MM-DD') as earliest_purchase,
+                        to_char(MAX(purchase_date), 'YYYY-MM-DD') as latest_purchase
+                    FROM costco_purchases
+                    WHERE purchase_date >= CURRENT_DATE - make_interval(days => %s);
+                """
+
+                cur.execute(query, (days_back,))
+                return cur.fetchone() or {}
+
+            except Exception:
+                logger.exception("Failed to get purchase summary")
+                return {}
+
+
+@lru_cache(maxsize=1)
+def get_db():
+    """
+    Get the process-wide GroceryDB instance.
 
-            cur.execute(query, (days_back,))
-            columns = [desc[0] for desc in cur.description]
-            row = cur.fetchone()
+    Returns:
+        GroceryDB: Shared database handler
+    """
+    return GroceryDB()
 
-            if row:
-                summary = dict(zip(columns, row, strict=False))
-                # Convert date objects to strings
-                if summary.get("earliest_purchase"):
-                    summary["earliest_purchase"] = summary["earliest_purchase"].isoformat()
-                if summary.get("latest_purchase"):
-                    summary["latest_purchase"] = summary["latest_purchase"].isoformat()
-                return summary
-            return {}
 
-        except Exception as e:
-            print(f"[ERROR] Failed to get purchase summary: {e}")
-            return {}
-        finally:
-            cur.close()
-            conn.close()
+# Digits and dots with at least one digit (what str.replace(".", "").isdigit() accepted)
+_ITEM_PRICE_RE = re.compile(r"\.*\d[\d.]*")
 
 
 def parse_costco_receipt_format(receipt_text):
@@ -859,7 +1304,7 @@ def parse_costco_receipt_format(receipt_text):
     Returns:
         dict: Parsed receipt data
     """
-    lines = receipt_text.strip().split("\n")
+    lines = receipt_text.strip().splitlines()
 
     # Initialize receipt data
     receipt_data = {
@@ -882,7 +1327,7 @@ def parse_costco_receipt_format(receipt_text):
                     "item_type": parts[0],
                     "item_code": parts[1],
                     "item_name": parts[2],
-                    "item_price": float(parts[3]) if parts[3].replace(".", "").isdigit() else 0.0,
+                    "item_price": float(parts[3]) if _ITEM_PRICE_RE.fullmatch(parts[3]) else 0.0,
                     "tax_indicator": parts[4] if len(parts) > 4 else "N",
                 }
                 receipt_data["items"].append(item)
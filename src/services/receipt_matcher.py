@@ -12,15 +12,17 @@ Author: AI Agent
 Date: 2025-07-11
 """
 
-import json
 import logging
+import logging.handlers
 import os
 import sys
-from dataclasses import dataclass
+from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from difflib import SequenceMatcher
 
-from psycopg2.extras import RealDictCursor
+from psycopg2 import sql
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from rapidfuzz import fuzz, process
 
 # Add scripts directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "scripts"))
@@ -28,13 +30,20 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
 from src.scripts.grocery_db import GroceryDB
 
 # Configure logging with bright colors for visibility
+LOG_FORMAT = "🔍 %(asctime)s - %(levelname)s - %(message)s"
+
+# File writes are buffered and flushed at the end of each matching run (or at once
+# on errors); the file itself isn't opened until the first record is written
+_file_handler = logging.FileHandler("receipt_matcher.log", delay=True)
+_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+_buffered_file_handler = logging.handlers.MemoryHandler(
+    capacity=1024, flushLevel=logging.ERROR, target=_file_handler
+)
+
 logging.basicConfig(
     level=logging.INFO,
-    format="🔍 %(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("receipt_matcher.log"),
-    ],
+    format=LOG_FORMAT,
+    handlers=[logging.StreamHandler(), _buffered_file_handler],
 )
 logger = logging.getLogger(__name__)
 
@@ -50,6 +59,14 @@ class PurchaseItem:
     price: float
     table_source: str
     raw_data: dict
+    norm_name: str = field(default="", compare=False)
+    # When the row was loaded (created_at), which drives the run watermark
+    ingested_at: datetime | None = field(default=None, compare=False)
+
+    def __post_init__(self):
+        # Normalize once here rather than on every comparison
+        if not self.norm_name:
+            self.norm_name = self.item_name.lower().strip()
 
 
 @dataclass
@@ -61,6 +78,12 @@ class ListItem:
     store: str
     is_checked: bool
     table_source: str
+    norm_name: str = field(default="", compare=False)
+
+    def __post_init__(self):
+        # Normalize once here rather than on every comparison
+        if not self.norm_name:
+            self.norm_name = self.item_name.lower().strip()
 
 
 @dataclass
@@ -76,15 +99,24 @@ class MatchResult:
 class ReceiptMatcher:
     """Main class for matching receipts to store lists"""
 
-    def __init__(self, lookback_hours: int = 24):
+    # Lists at least this long are narrowed with a trigram index before fuzzy scoring
+    CANDIDATE_INDEX_MIN_ITEMS = 1000
+
+    # Purchase names scored per cdist call
+    SCORE_CHUNK_SIZE = 256
+
+    def __init__(self, lookback_hours: int = 24, track_state: bool = True):
         """
         Initialize the receipt matcher
 
         Args:
             lookback_hours: How many hours back to look for recent purchases
+            track_state: Advance the receipt_matcher_state watermarks after each run
+                (test runs pass False so they don't move the production watermarks)
         """
         self.db = GroceryDB()
         self.lookback_hours = lookback_hours
+        self.track_state = track_state
         self.match_threshold = 0.8  # Minimum similarity score for fuzzy matching
 
         # Store table mappings
@@ -103,18 +135,118 @@ class ReceiptMatcher:
             "publix": "publix_list",
         }
 
+        # Quantity/price column names differ per retailer table
+        self.column_mappings = {
+            "costco_purchases": {
+                "quantity": "item_quantity",
+                "price": "item_price",
+            },
+            "walmart_purchases": {
+                "quantity": "item_quantity",
+                "price": "item_price",
+            },
+            "cvs_purchases": {
+                "quantity": "item_quantity",
+                "price": "item_price_final",
+            },
+            "publix_purchases": {
+                "quantity": "item_quantity",
+                "price": "item_price",
+            },
+            "other_purchases": {
+                "quantity": "quantity",
+                "price": "price",
+            },
+        }
+
+        # Set once ensure_tables_exist has confirmed the schema in this process
+        self._schema_ready = False
+
+        # One query across every purchase table, and one across every list, built once
+        self.recent_purchases_query = self._build_recent_purchases_query()
+        self.list_items_query = self._build_list_items_query()
+
         logger.info("🚀 RECEIPT MATCHER INITIALIZED")
         logger.info(f"📅 Looking back {lookback_hours} hours for recent purchases")
         logger.info(f"🎯 Match threshold: {self.match_threshold}")
 
-    def ensure_tables_exist(self):
+    def _required_relations(self) -> list[str]:
+        """Tables and indexes ensure_tables_exist always creates"""
+        relations = []
+        for table_name in self.list_tables.values():
+            relations += [table_name, f"idx_{table_name}_open"]
+        return relations + [
+            "inventory",
+            "idx_inventory_item_name",
+            "idx_inventory_store",
+            "idx_inventory_purchase_date",
+            "receipt_matcher_state",
+        ]
+
+    def _trigram_indexes(self) -> list[str]:
+        """Optional pg_trgm indexes, only created where the extension is available"""
+        return [f"idx_{table_name}_name_trgm" for table_name in self.list_tables.values()]
+
+    def _obsolete_indexes(self) -> list[str]:
+        """Indexes replaced by the partial open-items index"""
+        obsolete = []
+        for table_name in self.list_tables.values():
+            obsolete += [f"idx_{table_name}_item_name", f"idx_{table_name}_is_checked"]
+        return obsolete
+
+    def ensure_tables_exist(self, conn=None):
         """Create list and inventory tables if they don't exist"""
+        if self._schema_ready:
+            return
+
         logger.info("🔧 ENSURING REQUIRED TABLES EXIST")
 
-        conn = self.db.get_connection()
+        # Reuse the caller's connection when given one
+        own_conn = conn is None
+        if own_conn:
+            conn = self.db.get_connection()
         cur = conn.cursor()
 
         try:
+            # One catalog lookup; skip the DDL (and its locks) when nothing is missing
+            # and nothing obsolete is left over. Trigram indexes only count as missing
+            # when pg_trgm is installed, so a database without it doesn't rerun the DDL
+            cur.execute(
+                """
+                SELECT
+                    (SELECT COUNT(*) FROM unnest(%s::text[]) AS name
+                     WHERE to_regclass(name) IS NULL),
+                    (SELECT COUNT(*) FROM unnest(%s::text[]) AS name
+                     WHERE to_regclass(name) IS NULL
+                       AND EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')),
+                    (SELECT COUNT(*) FROM unnest(%s::text[]) AS name
+                     WHERE to_regclass(name) IS NOT NULL)
+                """,
+                (
+                    self._required_relations(),
+                    self._trigram_indexes(),
+                    self._obsolete_indexes(),
+                ),
+            )
+            missing, missing_trgm, obsolete = cur.fetchone()
+            if missing == 0 and missing_trgm == 0 and obsolete == 0:
+                conn.rollback()
+                self._schema_ready = True
+                logger.info("✅ ALL REQUIRED TABLES ALREADY EXIST")
+                return
+
+            # pg_trgm lets the substring (LIKE '%name%') list cleanup use a GIN index
+            # instead of scanning; it is optional, so skip it if it cannot be installed
+            cur.execute("SAVEPOINT pg_trgm")
+            try:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cur.execute("RELEASE SAVEPOINT pg_trgm")
+                has_trgm = True
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT pg_trgm")
+                logger.warning(f"⚠️ pg_trgm unavailable, skipping trigram indexes: {e}")
+                has_trgm = False
+
             # Create list tables for each store
             for _store, table_name in self.list_tables.items():
                 logger.info(f"📋 Creating {table_name} if not exists")
@@ -133,17 +265,35 @@ class ReceiptMatcher:
                     )
                 """)
 
-                # Create index for faster searching
+                # Matching only ever reads unchecked items, newest first; a partial
+                # index over just those replaces the item_name/is_checked indexes
                 cur.execute(f"""
-                    CREATE INDEX IF NOT EXISTS idx_{table_name}_item_name
-                    ON {table_name} (item_name)
+                    DROP INDEX IF EXISTS idx_{table_name}_item_name, idx_{table_name}_is_checked
                 """)
 
                 cur.execute(f"""
-                    CREATE INDEX IF NOT EXISTS idx_{table_name}_is_checked
-                    ON {table_name} (is_checked)
+                    CREATE INDEX IF NOT EXISTS idx_{table_name}_open
+                    ON {table_name} (created_at DESC)
+                    WHERE NOT is_checked
                 """)
 
+                if has_trgm:
+                    cur.execute(f"""
+                        CREATE INDEX IF NOT EXISTS idx_{table_name}_name_trgm
+                        ON {table_name} USING GIN (LOWER(item_name) gin_trgm_ops)
+                    """)
+
+            # Latest purchase row processed per purchase table (by created_at), so
+            # consecutive runs with overlapping lookback windows don't process the
+            # same purchase twice
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS receipt_matcher_state (
+                    table_name TEXT PRIMARY KEY,
+                    last_seen TIMESTAMP NOT NULL,
+                    updated_at TIMESTAMP DEFAULT NOW()
+                )
+            """)
+
             # Create inventory table
             logger.info("📦 Creating inventory table if not exists")
             cur.execute("""
@@ -183,6 +333,7 @@ class ReceiptMatcher:
             """)
 
             conn.commit()
+            self._schema_ready = True
             logger.info("✅ ALL REQUIRED TABLES CREATED SUCCESSFULLY")
 
         except Exception as e:
@@ -191,90 +342,125 @@ class ReceiptMatcher:
             raise
         finally:
             cur.close()
-            conn.close()
+            if own_conn:
+                conn.close()
+
+    def _build_recent_purchases_query(self) -> sql.Composed:
+        """Build a single UNION ALL query over all purchase tables"""
+        selects = []
+        for store, table_name in self.purchase_tables.items():
+            mapping = self.column_mappings.get(table_name, {})
+            quantity_col = mapping.get("quantity", "item_quantity")
+            price_col = mapping.get("price", "item_price")
+
+            selects.append(
+                sql.SQL("""
+                SELECT
+                    {store} AS store,
+                    {table_source} AS table_source,
+                    item_name,
+                    purchase_date,
+                    purchase_time,
+                    {quantity_col} AS item_quantity,
+                    {price_col} AS item_price,
+                    raw_data,
+                    created_at
+                FROM {table_name}
+                WHERE (purchase_date > %(cutoff_date)s
+                       OR (purchase_date = %(cutoff_date)s
+                           AND COALESCE(purchase_time, '00:00') >= %(cutoff_time)s))
+                  -- Skip rows an earlier run already processed; keyed on load time so
+                  -- receipts loaded late with older purchase dates are still seen
+                  AND created_at > COALESCE(
+                      (SELECT last_seen FROM receipt_matcher_state
+                       WHERE table_name = {table_source}),
+                      '-infinity'
+                  )
+            """).format(
+                    store=sql.Literal(store),
+                    table_source=sql.Literal(table_name),
+                    quantity_col=sql.Identifier(quantity_col),
+                    price_col=sql.Identifier(price_col),
+                    table_name=sql.Identifier(table_name),
+                )
+            )
+
+        return sql.SQL(" UNION ALL ").join(selects) + sql.SQL(
+            " ORDER BY purchase_date DESC, purchase_time DESC"
+        )
+
+    def _build_list_items_query(self) -> sql.Composed:
+        """Build a single UNION ALL query over the unchecked items of all store lists"""
+        selects = [
+            sql.SQL("""
+                SELECT
+                    id,
+                    item_name,
+                    is_checked,
+                    created_at,
+                    {position} AS list_position,
+                    {store} AS store,
+                    {table_source} AS table_source
+                FROM {table_name}
+                WHERE NOT is_checked
+            """).format(
+                position=sql.Literal(position),
+                store=sql.Literal(store),
+                table_source=sql.Literal(table_name),
+                table_name=sql.Identifier(table_name),
+            )
+            for position, (store, table_name) in enumerate(self.list_tables.items())
+        ]
 
-    def get_recent_purchases(self) -> list[PurchaseItem]:
+        # Keep the per-list order (lists in turn, newest items first)
+        return sql.SQL(" UNION ALL ").join(selects) + sql.SQL(
+            " ORDER BY list_position, created_at DESC"
+        )
+
+    def get_recent_purchases(self, conn=None) -> list[PurchaseItem]:
         """Get recent purchases from all purchase tables"""
         logger.info("🛒 FETCHING RECENT PURCHASES")
 
         cutoff_time = datetime.now() - timedelta(hours=self.lookback_hours)
         purchases = []
 
-        conn = self.db.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Define column mappings for each retailer
-        column_mappings = {
-            "costco_purchases": {
-                "quantity": "item_quantity",
-                "price": "item_price",
-            },
-            "walmart_purchases": {
-                "quantity": "item_quantity",
-                "price": "item_price",
-            },
-            "cvs_purchases": {
-                "quantity": "item_quantity",
-                "price": "item_price_final",
-            },
-            "publix_purchases": {
-                "quantity": "item_quantity",
-                "price": "item_price",
-            },
-            "other_purchases": {
-                "quantity": "quantity",
-                "price": "price",
-            },
-        }
+        # Reuse the caller's connection when given one
+        own_conn = conn is None
+        if own_conn:
+            conn = self.db.get_connection()
+        # Server-side cursor streams rows instead of buffering the whole result
+        cur = conn.cursor(name="recent_purchases", cursor_factory=RealDictCursor)
+        cur.itersize = 2000
 
         try:
-            for store, table_name in self.purchase_tables.items():
-                logger.info(f"📊 Checking {table_name} for recent purchases")
-
-                # Get column mapping for this table
-                mapping = column_mappings.get(table_name, {})
-                quantity_col = mapping.get("quantity", "item_quantity")
-                price_col = mapping.get("price", "item_price")
-
-                # Get recent purchases from this table
-                cur.execute(
-                    f"""
-                    SELECT
-                        item_name,
-                        purchase_date,
-                        purchase_time,
-                        {quantity_col} as item_quantity,
-                        {price_col} as item_price,
-                        raw_data
-                    FROM {table_name}
-                    WHERE purchase_date >= %s
-                    ORDER BY purchase_date DESC, purchase_time DESC
-                """,
-                    (cutoff_time.date(),),
-                )
+            # The exact cutoff (date and time) is applied in SQL
+            cur.execute(
+                self.recent_purchases_query,
+                {"cutoff_date": cutoff_time.date(), "cutoff_time": cutoff_time.time()},
+            )
 
-                rows = cur.fetchall()
-                logger.info(f"📈 Found {len(rows)} recent purchases in {table_name}")
+            table_counts = dict.fromkeys(self.purchase_tables.values(), 0)
+            for row in cur:
+                table_counts[row["table_source"]] += 1
 
-                for row in rows:
+                purchase = PurchaseItem(
+                    item_name=row["item_name"].strip(),
+                    store=row["store"],
                     # Combine date and time for full datetime
-                    purchase_datetime = datetime.combine(
+                    purchase_date=datetime.combine(
                         row["purchase_date"],
                         row["purchase_time"] or datetime.min.time(),
-                    )
+                    ),
+                    quantity=row["item_quantity"] or 1,
+                    price=float(row["item_price"] or 0),
+                    table_source=row["table_source"],
+                    raw_data=row["raw_data"] or {},
+                    ingested_at=row["created_at"],
+                )
+                purchases.append(purchase)
 
-                    # Only include if within our time window
-                    if purchase_datetime >= cutoff_time:
-                        purchase = PurchaseItem(
-                            item_name=row["item_name"].strip(),
-                            store=store,
-                            purchase_date=purchase_datetime,
-                            quantity=row["item_quantity"] or 1,
-                            price=float(row["item_price"] or 0),
-                            table_source=table_name,
-                            raw_data=row["raw_data"] or {},
-                        )
-                        purchases.append(purchase)
+            for table_name, count in table_counts.items():
+                logger.info(f"📈 Found {count} recent purchases in {table_name}")
 
             logger.info(f"🎯 TOTAL RECENT PURCHASES FOUND: {len(purchases)}")
             return purchases
@@ -284,38 +470,37 @@ class ReceiptMatcher:
             return []
         finally:
             cur.close()
-            conn.close()
+            if own_conn:
+                conn.close()
 
-    def get_all_list_items(self) -> list[ListItem]:
-        """Get all items from all store lists"""
+    def get_all_list_items(self, conn=None) -> list[ListItem]:
+        """Get all unchecked items from all store lists"""
         logger.info("📋 FETCHING ALL LIST ITEMS")
 
         list_items = []
-        conn = self.db.get_connection()
+        # Reuse the caller's connection when given one
+        own_conn = conn is None
+        if own_conn:
+            conn = self.db.get_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
 
         try:
-            for store, table_name in self.list_tables.items():
-                logger.info(f"📝 Checking {table_name} for list items")
-
-                cur.execute(f"""
-                    SELECT id, item_name, is_checked
-                    FROM {table_name}
-                    ORDER BY created_at DESC
-                """)
-
-                rows = cur.fetchall()
-                logger.info(f"📊 Found {len(rows)} items in {table_name}")
+            cur.execute(self.list_items_query)
+
+            table_counts = dict.fromkeys(self.list_tables.values(), 0)
+            for row in cur.fetchall():
+                table_counts[row["table_source"]] += 1
+                list_item = ListItem(
+                    id=row["id"],
+                    item_name=row["item_name"].strip(),
+                    store=row["store"],
+                    is_checked=row["is_checked"],
+                    table_source=row["table_source"],
+                )
+                list_items.append(list_item)
 
-                for row in rows:
-                    list_item = ListItem(
-                        id=row["id"],
-                        item_name=row["item_name"].strip(),
-                        store=store,
-                        is_checked=row["is_checked"],
-                        table_source=table_name,
-                    )
-                    list_items.append(list_item)
+            for table_name, count in table_counts.items():
+                logger.info(f"📊 Found {count} items in {table_name}")
 
             logger.info(f"🎯 TOTAL LIST ITEMS FOUND: {len(list_items)}")
             return list_items
@@ -325,7 +510,8 @@ class ReceiptMatcher:
             return []
         finally:
             cur.close()
-            conn.close()
+            if own_conn:
+                conn.close()
 
     def calculate_similarity(self, str1: str, str2: str) -> float:
         """Calculate similarity between two strings using fuzzy matching"""
@@ -337,8 +523,84 @@ class ReceiptMatcher:
         if s1 == s2:
             return 1.0
 
-        # Use SequenceMatcher for fuzzy matching
-        return SequenceMatcher(None, s1, s2).ratio()
+        # RapidFuzz's normalized InDel similarity; close to difflib.SequenceMatcher's
+        # Ratcliff/Obershelp ratio but not identical, so scores can differ slightly
+        return fuzz.ratio(s1, s2) / 100.0
+
+    @staticmethod
+    def _trigrams(name: str) -> set[str]:
+        """Character trigrams of a normalized name"""
+        return {name[i : i + 3] for i in range(len(name) - 2)}
+
+    def _build_candidate_index(self, candidate_names: list[str]) -> dict[str, list[int]]:
+        """
+        Build a trigram -> candidate positions inverted index over list item names
+
+        Trigrams found in more than 10% of the names say little about a match
+        (like stop words) and are left out.
+        """
+        postings = defaultdict(list)
+        for position, name in enumerate(candidate_names):
+            for trigram in self._trigrams(name):
+                postings[trigram].append(position)
+
+        limit = max(1, len(candidate_names) // 10)
+        return {trigram: ids for trigram, ids in postings.items() if len(ids) <= limit}
+
+    def _best_fuzzy_matches(
+        self, purchase_names: list[str], candidates: list[ListItem], candidate_names: list[str]
+    ) -> dict[str, tuple[ListItem, float]]:
+        """Best above-threshold list item (and score) for each purchase name"""
+        best_by_name = {}
+        if not purchase_names or not candidate_names:
+            return best_by_name
+
+        score_cutoff = self.match_threshold * 100
+
+        if len(candidate_names) < self.CANDIDATE_INDEX_MIN_ITEMS:
+            # Score purchase names against every candidate in multithreaded C++
+            # calls (workers=-1 spreads each one over all cores); chunking the rows
+            # keeps the score matrix small however many purchases there are.
+            # Below-threshold scores come back as 0
+            for start in range(0, len(purchase_names), self.SCORE_CHUNK_SIZE):
+                chunk = purchase_names[start : start + self.SCORE_CHUNK_SIZE]
+                scores = process.cdist(
+                    chunk,
+                    candidate_names,
+                    scorer=fuzz.ratio,
+                    score_cutoff=score_cutoff,
+                    workers=-1,
+                )
+                best_indexes = scores.argmax(axis=1)
+                best_scores = scores.max(axis=1)
+                for purchase_name, index, score in zip(
+                    chunk, best_indexes, best_scores, strict=True
+                ):
+                    if score > 0:
+                        best_by_name[purchase_name] = (candidates[index], float(score) / 100.0)
+            return best_by_name
+
+        # Large lists: only score candidates sharing a distinctive trigram
+        index = self._build_candidate_index(candidate_names)
+        for purchase_name in purchase_names:
+            trigrams = [trigram for trigram in self._trigrams(purchase_name) if trigram in index]
+            if trigrams:
+                positions = sorted({pos for trigram in trigrams for pos in index[trigram]})
+            else:
+                # Nothing distinctive to go on; fall back to every candidate
+                positions = range(len(candidate_names))
+
+            result = process.extractOne(
+                purchase_name,
+                [candidate_names[pos] for pos in positions],
+                scorer=fuzz.ratio,
+                score_cutoff=score_cutoff,
+            )
+            if result:
+                _, score, choice = result
+                best_by_name[purchase_name] = (candidates[positions[choice]], score / 100.0)
+
+        return best_by_name
 
     def find_matches(
         self, purchases: list[PurchaseItem], list_items: list[ListItem]
@@ -348,38 +610,61 @@ class ReceiptMatcher:
 
         matches = []
 
-        for purchase in purchases:
-            logger.info(f"🛒 Processing purchase: {purchase.item_name} from {purchase.store}")
+        # Skip already checked items
+        candidates = [list_item for list_item in list_items if not list_item.is_checked]
+        candidate_names = [list_item.norm_name for list_item in candidates]
 
-            best_match = None
-            best_score = 0.0
+        # Exact (normalized) name matches need no fuzzy scoring at all
+        by_name = defaultdict(list)
+        for list_item in candidates:
+            by_name[list_item.norm_name].append(list_item)
 
-            # Look for matches in all lists
-            for list_item in list_items:
-                if list_item.is_checked:
-                    continue  # Skip already checked items
+        # Everything else goes through fuzzy scoring
+        purchase_names = list(
+            dict.fromkeys(
+                purchase.norm_name for purchase in purchases if purchase.norm_name not in by_name
+            )
+        )
+        best_by_name = self._best_fuzzy_matches(purchase_names, candidates, candidate_names)
 
-                similarity = self.calculate_similarity(purchase.item_name, list_item.item_name)
+        # Per-item lines only at DEBUG; the INFO log gets one summary line
+        debug = logger.isEnabledFor(logging.DEBUG)
+        action_counts = dict.fromkeys(("mark_checked", "remove_from_other_lists", "no_action"), 0)
 
-                if similarity > best_score and similarity >= self.match_threshold:
-                    best_score = similarity
-                    best_match = list_item
+        for purchase in purchases:
+            if debug:
+                logger.debug(f"🛒 Processing purchase: {purchase.item_name} from {purchase.store}")
+
+            exact_matches = by_name.get(purchase.norm_name)
+            if exact_matches:
+                # Prefer the purchase store's own list
+                best_match = next(
+                    (item for item in exact_matches if item.store == purchase.store),
+                    exact_matches[0],
+                )
+                best_score = 1.0
+            else:
+                best_match, best_score = best_by_name.get(purchase.norm_name, (None, 0.0))
 
             # Determine action based on match
             if best_match:
                 if best_match.store == purchase.store:
                     action = "mark_checked"
-                    logger.info(
-                        f"✅ SAME STORE MATCH: {purchase.item_name} → {best_match.item_name} (score: {best_score:.2f})"
-                    )
+                    if debug:
+                        logger.debug(
+                            f"✅ SAME STORE MATCH: {purchase.item_name} → {best_match.item_name} (score: {best_score:.2f})"
+                        )
                 else:
                     action = "remove_from_other_lists"
-                    logger.info(
-                        f"🔄 CROSS STORE MATCH: {purchase.item_name} → {best_match.item_name} (score: {best_score:.2f})"
-                    )
+                    if debug:
+                        logger.debug(
+                            f"🔄 CROSS STORE MATCH: {purchase.item_name} → {best_match.item_name} (score: {best_score:.2f})"
+                        )
             else:
                 action = "no_action"
-                logger.info(f"❌ NO MATCH: {purchase.item_name}")
+                if debug:
+                    logger.debug(f"❌ NO MATCH: {purchase.item_name}")
+            action_counts[action] += 1
 
             match_result = MatchResult(
                 purchase_item=purchase,
@@ -389,10 +674,15 @@ class ReceiptMatcher:
             )
             matches.append(match_result)
 
-        logger.info(f"🎯 MATCHING COMPLETED: {len(matches)} results")
+        logger.info(
+            f"🎯 MATCHING COMPLETED: {len(matches)} results "
+            f"({action_counts['mark_checked']} same store, "
+            f"{action_counts['remove_from_other_lists']} cross store, "
+            f"{action_counts['no_action']} no match)"
+        )
         return matches
 
-    def execute_actions(self, matches: list[MatchResult]) -> dict[str, int]:
+    def execute_actions(self, matches: list[MatchResult], conn=None) -> dict[str, int]:
         """Execute actions based on match results"""
         logger.info("⚡ EXECUTING ACTIONS BASED ON MATCHES")
 
@@ -404,18 +694,36 @@ class ReceiptMatcher:
             "errors": 0,
         }
 
-        conn = self.db.get_connection()
+        # Reuse the caller's connection when given one
+        own_conn = conn is None
+        if own_conn:
+            conn = self.db.get_connection()
         cur = conn.cursor()
 
+        # Inventory rows and checked list-item ids are collected during the loop and
+        # written in batches afterwards
+        inventory_rows = []
+        checked_ids = defaultdict(list)
+        remove_patterns = []
+        debug = logger.isEnabledFor(logging.DEBUG)
+
         try:
             for match in matches:
                 try:
                     if match.action == "mark_checked":
-                        self._mark_item_checked(cur, match)
+                        if debug:
+                            logger.debug(
+                                f"✅ MARKING CHECKED: {match.list_item.item_name} in {match.list_item.table_source}"
+                            )
+                        checked_ids[match.list_item.table_source].append(match.list_item.id)
                         stats["marked_checked"] += 1
 
                     elif match.action == "remove_from_other_lists":
-                        self._remove_from_other_lists(cur, match)
+                        if debug:
+                            logger.debug(
+                                f"🗑️ REMOVING FROM ALL LISTS: {match.purchase_item.item_name}"
+                            )
+                        remove_patterns.append(f"%{match.purchase_item.item_name.lower()}%")
                         stats["removed_from_lists"] += 1
 
                     elif match.action == "no_action":
@@ -423,14 +731,29 @@ class ReceiptMatcher:
 
                     # Always add to inventory for matched items
                     if match.list_item:
-                        self._add_to_inventory(cur, match)
-                        stats["inventory_added"] += 1
+                        if debug:
+                            logger.debug(f"📦 ADDING TO INVENTORY: {match.purchase_item.item_name}")
+                        inventory_rows.append(self._inventory_row(match))
 
                 except Exception as e:
                     logger.error(f"❌ ERROR PROCESSING MATCH: {e}")
                     stats["errors"] += 1
                     continue
 
+            for table_name, ids in checked_ids.items():
+                self._mark_items_checked(cur, table_name, ids)
+
+            if remove_patterns:
+                self._remove_from_other_lists(cur, remove_patterns)
+
+            if inventory_rows:
+                self._add_to_inventory(cur, inventory_rows)
+                stats["inventory_added"] = len(inventory_rows)
+
+            # Committed together with the actions above
+            if self.track_state:
+                self._update_watermarks(cur, matches)
+
             conn.commit()
             logger.info("✅ ALL ACTIONS EXECUTED SUCCESSFULLY")
 
@@ -440,88 +763,114 @@ class ReceiptMatcher:
             raise
         finally:
             cur.close()
-            conn.close()
+            if own_conn:
+                conn.close()
 
         return stats
 
-    def _mark_item_checked(self, cur, match: MatchResult):
-        """Mark a list item as checked"""
-        logger.info(
-            f"✅ MARKING CHECKED: {match.list_item.item_name} in {match.list_item.table_source}"
-        )
-
+    def _mark_items_checked(self, cur, table_name: str, ids: list[int]):
+        """Mark list items as checked with one UPDATE per list table"""
         cur.execute(
             f"""
-            UPDATE {match.list_item.table_source}
+            UPDATE {table_name}
             SET is_checked = TRUE,
                 checked_at = NOW(),
                 updated_at = NOW()
-            WHERE id = %s
+            WHERE id = ANY(%s)
         """,
-            (match.list_item.id,),
+            (ids,),
         )
 
-    def _remove_from_other_lists(self, cur, match: MatchResult):
-        """Remove item from all store lists when found in other_purchases"""
-        logger.info(f"🗑️ REMOVING FROM ALL LISTS: {match.purchase_item.item_name}")
-
-        # Find similar items in all lists and remove them
+    def _remove_from_other_lists(self, cur, remove_patterns: list[str]):
+        """Remove items from all store lists when found in other_purchases"""
+        # Find similar items in all lists and remove them, one DELETE per list
         for _store, table_name in self.list_tables.items():
             cur.execute(
                 f"""
                 DELETE FROM {table_name}
-                WHERE LOWER(item_name) LIKE LOWER(%s)
-                OR LOWER(%s) LIKE LOWER(item_name)
+                WHERE LOWER(item_name) LIKE ANY(%s)
             """,
-                (
-                    f"%{match.purchase_item.item_name}%",
-                    f"%{match.purchase_item.item_name}%",
-                ),
+                (remove_patterns,),
             )
 
             if cur.rowcount > 0:
                 logger.info(f"🗑️ Removed {cur.rowcount} items from {table_name}")
 
-    def _add_to_inventory(self, cur, match: MatchResult):
-        """Add purchase to inventory"""
-        logger.info(f"📦 ADDING TO INVENTORY: {match.purchase_item.item_name}")
+    def _update_watermarks(self, cur, matches: list[MatchResult]):
+        """Record the latest processed purchase load time per purchase table"""
+        last_seen = {}
+        for match in matches:
+            purchase = match.purchase_item
+            if purchase.ingested_at is None:
+                continue
+            if purchase.ingested_at > last_seen.get(purchase.table_source, datetime.min):
+                last_seen[purchase.table_source] = purchase.ingested_at
+
+        if not last_seen:
+            return
+
+        execute_values(
+            cur,
+            """
+            INSERT INTO receipt_matcher_state (table_name, last_seen) VALUES %s
+            ON CONFLICT (table_name) DO UPDATE
+            SET last_seen = GREATEST(receipt_matcher_state.last_seen, EXCLUDED.last_seen),
+                updated_at = NOW()
+            """,
+            list(last_seen.items()),
+        )
+
+    def _inventory_row(self, match: MatchResult) -> tuple:
+        """Build the inventory row for a matched purchase"""
+        return (
+            match.purchase_item.item_name,
+            match.purchase_item.store,
+            match.purchase_item.quantity,
+            match.purchase_item.purchase_date.date(),
+            match.purchase_item.purchase_date.time(),
+            match.purchase_item.price,
+            match.purchase_item.table_source,
+            # psycopg2 serializes this straight into the statement as a JSON literal
+            Json(match.purchase_item.raw_data),
+        )
 
-        cur.execute(
+    def _add_to_inventory(self, cur, inventory_rows: list[tuple]):
+        """Add purchases to inventory with a single multi-row INSERT"""
+        execute_values(
+            cur,
             """
             INSERT INTO inventory (
                 item_name, store, quantity, purchase_date, purchase_time,
                 price, purchase_table_source, raw_purchase_data
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """,
-            (
-                match.purchase_item.item_name,
-                match.purchase_item.store,
-                match.purchase_item.quantity,
-                match.purchase_item.purchase_date.date(),
-                match.purchase_item.purchase_date.time(),
-                match.purchase_item.price,
-                match.purchase_item.table_source,
-                json.dumps(match.purchase_item.raw_data),
-            ),
+            ) VALUES %s
+            """,
+            inventory_rows,
+            template="(%s, %s, %s, %s, %s, %s, %s, %s::jsonb)",
+            page_size=1000,
         )
 
-    def run_matching_process(self) -> dict[str, int]:
+    def run_matching_process(self, conn=None) -> dict[str, int]:
         """Run the complete matching process"""
         logger.info("🚀 STARTING RECEIPT MATCHING PROCESS")
         logger.info("=" * 60)
 
+        # One connection for every step instead of a fresh connect per step
+        own_conn = conn is None
+        if own_conn:
+            conn = self.db.get_connection()
+
         try:
             # Ensure tables exist
-            self.ensure_tables_exist()
+            self.ensure_tables_exist(conn)
 
             # Get recent purchases
-            purchases = self.get_recent_purchases()
+            purchases = self.get_recent_purchases(conn)
             if not purchases:
                 logger.info("ℹ️ No recent purchases found, nothing to process")
                 return {"no_purchases": 1}
 
             # Get all list items
-            list_items = self.get_all_list_items()
+            list_items = self.get_all_list_items(conn)
             if not list_items:
                 logger.info("ℹ️ No list items found, nothing to match against")
                 return {"no_list_items": 1}
@@ -530,7 +879,7 @@ class ReceiptMatcher:
             matches = self.find_matches(purchases, list_items)
 
             # Execute actions
-            stats = self.execute_actions(matches)
+            stats = self.execute_actions(matches, conn)
 
             # Log summary
             logger.info("📊 RECEIPT MATCHING SUMMARY")
@@ -549,6 +898,11 @@ class ReceiptMatcher:
         except Exception as e:
             logger.error(f"💥 FATAL ERROR IN MATCHING PROCESS: {e}")
             raise
+        finally:
+            if own_conn:
+                conn.close()
+            # Write this run's buffered records out now rather than on a later run
+            _buffered_file_handler.flush()
 
 
 def main():
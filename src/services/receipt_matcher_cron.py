@@ -9,14 +9,20 @@ Cron job setup:
 # Run every 30 minutes
 */30 * * * * /usr/bin/python3 /path/to/receipt_matcher_cron.py >> /var/log/receipt_matcher.log 2>&1
 
+Daemon mode (one long-running process that reuses its database connection and
+matcher, so the schema check and query building happen once rather than per run):
+/usr/bin/python3 /path/to/receipt_matcher_cron.py --daemon --interval-minutes 30
+
 Author: AI Agent
 Date: 2025-07-11
 """
 
+import argparse
 import json
 import logging
 import os
 import sys
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -40,7 +46,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def run_cron_job():
+STATUS_FILE = Path(__file__).parent / "logs" / "last_run_status.json"
+
+
+def write_status(status_data: dict) -> None:
+    """Write the last-run status file used for monitoring"""
+    with open(STATUS_FILE, "w") as f:
+        json.dump(status_data, f, indent=2)
+
+
+def run_cron_job(matcher: ReceiptMatcher | None = None, conn=None):
     """Run the receipt matcher as a cron job"""
     logger.info("🚀 STARTING RECEIPT MATCHER CRON JOB")
     logger.info(f"📅 Execution time: {datetime.now()}")
@@ -48,25 +63,24 @@ def run_cron_job():
     try:
         # Create matcher instance with 30-minute lookback
         # This ensures we catch purchases since the last run
-        matcher = ReceiptMatcher(lookback_hours=1)  # 1 hour to be safe
+        if matcher is None:
+            matcher = ReceiptMatcher(lookback_hours=1)  # 1 hour to be safe
 
         # Run the matching process
-        stats = matcher.run_matching_process()
+        stats = matcher.run_matching_process(conn)
 
         # Log results for monitoring
         logger.info("📊 CRON JOB COMPLETED SUCCESSFULLY")
         logger.info(f"📈 Processing stats: {json.dumps(stats, indent=2)}")
 
         # Create status file for monitoring
-        status_file = Path(__file__).parent / "logs" / "last_run_status.json"
-        status_data = {
-            "timestamp": datetime.now().isoformat(),
-            "status": "success",
-            "stats": stats,
-        }
-
-        with open(status_file, "w") as f:
-            json.dump(status_data, f, indent=2)
+        write_status(
+            {
+                "timestamp": datetime.now().isoformat(),
+                "status": "success",
+                "stats": stats,
+            }
+        )
 
         return 0
 
@@ -74,18 +88,72 @@ def run_cron_job():
         logger.error(f"💥 CRON JOB FAILED: {e}")
 
         # Create error status file
-        status_file = Path(__file__).parent / "logs" / "last_run_status.json"
-        status_data = {
-            "timestamp": datetime.now().isoformat(),
-            "status": "error",
-            "error": str(e),
-        }
-
-        with open(status_file, "w") as f:
-            json.dump(status_data, f, indent=2)
+        write_status(
+            {
+                "timestamp": datetime.now().isoformat(),
+                "status": "error",
+                "error": str(e),
+            }
+        )
 
         return 1
 
 
+def run_daemon(interval_minutes: int = 30):
+    """Run the cron job on an interval from a single long-lived process"""
+    logger.info(f"🔁 STARTING RECEIPT MATCHER DAEMON (every {interval_minutes} minutes)")
+
+    # One matcher for the life of the process: its schema check and prebuilt queries
+    # carry over between runs, the watermark state it reads each run stays in
+    # receipt_matcher_state, and logging handlers are set up once at import
+    matcher = ReceiptMatcher(lookback_hours=1)
+    interval_seconds = interval_minutes * 60
+    conn = None
+
+    try:
+        while True:
+            started = time.monotonic()
+
+            try:
+                if conn is None or conn.closed:
+                    conn = matcher.db.get_connection()
+            except Exception as e:
+                logger.error(f"💥 Could not connect to database: {e}")
+                conn = None
+
+            if conn is not None:
+                if run_cron_job(matcher, conn) == 0:
+                    # Don't sit idle in a read transaction until the next run
+                    conn.rollback()
+                else:
+                    # Drop a possibly broken connection; the next run reconnects
+                    conn.close()
+                    conn = None
+
+            time.sleep(max(0.0, interval_seconds - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        logger.info("🛑 Receipt matcher daemon stopped")
+        return 0
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def main():
+    """Parse arguments and run once or as a daemon"""
+    parser = argparse.ArgumentParser(description="Run the receipt matcher")
+    parser.add_argument(
+        "--daemon", action="store_true", help="Keep running and match on an interval"
+    )
+    parser.add_argument(
+        "--interval-minutes", type=int, default=30, help="Minutes between daemon runs"
+    )
+    args = parser.parse_args()
+
+    if args.daemon:
+        return run_daemon(args.interval_minutes)
+    return run_cron_job()
+
+
 if __name__ == "__main__":
-    exit(run_cron_job())
+    exit(main())
@@ -12,32 +12,91 @@ Author: AI Agent
 Date: 2025-07-11
 """
 
+import atexit
 import logging
 import os
-import sys
+import queue
+import subprocess
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from typing import Final
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+# Directory holding this script, the receipt matcher scripts it sets up, and the
+# project root the API and tests live under
+SCRIPT_DIR = Path(__file__).resolve().parent
+SERVICES_DIR = SCRIPT_DIR.parent / "services"
+PROJECT_DIR = SCRIPT_DIR.parents[1]
+
+# Sample items for each store, seeded into lists that have no real items yet
+_SAMPLE_DATA: Final[Mapping[str, tuple[tuple[str, int, str], ...]]] = {
+    "costco_list": (
+        ("Bananas 3 lb", 2, "high"),
+        ("Organic Milk 1 gal", 1, "high"),
+        ("Bread Loaf", 1, "medium"),
+        ("Chicken Breast 5 lb", 1, "high"),
+        ("Apples 3 lb", 2, "medium"),
+    ),
+    "walmart_list": (
+        ("Eggs 12 count", 1, "high"),
+        ("Cheese Slices", 1, "medium"),
+        ("Greek Yogurt", 2, "medium"),
+        ("Cereal Box", 1, "low"),
+    ),
+    "cvs_list": (
+        ("Multivitamins", 1, "low"),
+        ("Shampoo", 1, "medium"),
+        ("Toothpaste", 1, "high"),
+    ),
+    "publix_list": (
+        ("Orange Juice", 1, "medium"),
+        ("Pasta", 2, "low"),
+        ("Tomato Sauce", 2, "low"),
+    ),
+}
+
+# Only seeds a list that has no non-test items yet, checked in the INSERT itself
+_SEED_LIST_SQL = sql.SQL("""
+    INSERT INTO {table} (item_name, quantity_needed, priority)
+    SELECT v.* FROM (VALUES %s) AS v(item_name, quantity_needed, priority)
+    WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE item_name NOT LIKE 'TEST_%%')
+""")
+
+# Configure logging (a no-op if an imported module already configured it)
+logging.basicConfig(level=logging.INFO, format="🔧 %(asctime)s - %(message)s")
 
-# Add current directory to path
-sys.path.append(os.path.dirname(__file__))
-from receipt_matcher import ReceiptMatcher
-from test_receipt_matcher import ReceiptMatcherTester
+# Hand the configured handlers to a background listener and have loggers only
+# enqueue records, so the (possibly parallel) setup steps never block on log I/O
+_root_logger = logging.getLogger()
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+_root_logger.handlers = [QueueHandler(_log_queue)]
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="🔧 %(asctime)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 
-def setup_database_tables():
+def setup_database_tables(db):
     """Setup required database tables"""
     logger.info("🗃️ SETTING UP DATABASE TABLES")
 
     try:
+        from src.services.receipt_matcher import ReceiptMatcher
+
         matcher = ReceiptMatcher()
-        matcher.ensure_tables_exist()
+        with db.connection() as conn:
+            matcher.ensure_tables_exist(conn)
         logger.info("✅ Database tables created successfully")
         return True
-    except Exception as e:
-        logger.error(f"❌ Failed to create database tables: {e}")
+    except Exception:
+        logger.exception("❌ Failed to create database tables")
         return False
 
 
@@ -46,6 +105,8 @@ def run_tests():
     logger.info("🧪 RUNNING COMPREHENSIVE TESTS")
 
     try:
+        from tests.test_receipt_matcher import ReceiptMatcherTester
+
         tester = ReceiptMatcherTester()
         success = tester.run_full_test_suite()
 
@@ -55,20 +116,37 @@ def run_tests():
             logger.error("❌ Some tests failed")
 
         return success
-    except Exception as e:
-        logger.error(f"❌ Test execution failed: {e}")
+    except Exception:
+        logger.exception("❌ Test execution failed")
+        return False
+
+
+def _ensure_executable(path, mode=0o755):
+    """chmod a script only if its permission bits are not already set to mode"""
+    if os.stat(path).st_mode & 0o777 != mode:
+        os.chmod(path, mode)
+
+
+def install_cron_entry(cron_entry):
+    """Add cron_entry to the user's crontab unless it is already there"""
+    # crontab -l exits non-zero when the user has no crontab yet
+    existing = subprocess.run(["crontab", "-l"], capture_output=True, text=True).stdout
+    if cron_entry in existing.splitlines():
         return False
 
+    if existing and not existing.endswith("\n"):
+        existing += "\n"
+    subprocess.run(["crontab", "-"], input=f"{existing}{cron_entry}\n", text=True, check=True)
+    return True
+
 
 def setup_cron_job():
     """Setup cron job for automatic execution"""
     logger.info("⏰ SETTING UP CRON JOB")
 
     try:
-        # Get current script directory
-        script_dir = Path(__file__).parent.absolute()
-        cron_script = script_dir / "receipt_matcher_cron.py"
-        log_dir = script_dir / "logs"
+        cron_script = SERVICES_DIR / "receipt_matcher_cron.py"
+        log_dir = SERVICES_DIR / "logs"
 
         # Create logs directory
         log_dir.mkdir(exist_ok=True)
@@ -76,124 +154,113 @@ def setup_cron_job():
         # Create cron job entry
         cron_entry = f"*/30 * * * * /usr/bin/python3 {cron_script} >> {log_dir}/receipt_matcher_cron.log 2>&1"
 
-        logger.info(f"📝 Cron job entry: {cron_entry}")
-        logger.info("⚠️  To install the cron job, run:")
-        logger.info(f"   echo '{cron_entry}' | crontab -")
-        logger.info("   OR manually add to crontab with: crontab -e")
+        logger.info("📝 Cron job entry: %s", cron_entry)
 
         # Make scripts executable
-        os.chmod(cron_script, 0o755)
-        os.chmod(script_dir / "receipt_matcher.py", 0o755)
-
-        logger.info("✅ Cron job setup completed (manual installation required)")
+        _ensure_executable(cron_script)
+        _ensure_executable(SERVICES_DIR / "receipt_matcher.py")
+
+        try:
+            installed = install_cron_entry(cron_entry)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("⚠️  Could not install the cron job automatically: %s", e)
+            logger.info("⚠️  To install the cron job, run:")
+            logger.info("   echo '%s' | crontab -", cron_entry)
+            logger.info("   OR manually add to crontab with: crontab -e")
+            logger.info("✅ Cron job setup completed (manual installation required)")
+            return True
+
+        if installed:
+            logger.info("✅ Cron job installed")
+        else:
+            logger.info("✅ Cron job already installed, leaving crontab unchanged")
         return True
 
-    except Exception as e:
-        logger.error(f"❌ Failed to setup cron job: {e}")
+    except Exception:
+        logger.exception("❌ Failed to setup cron job")
         return False
 
 
-def create_sample_list_data():
+def create_sample_list_data(db):
     """Create sample list data for demonstration"""
     logger.info("📋 CREATING SAMPLE LIST DATA")
 
     try:
-        from scripts.grocery_db import GroceryDB
-
-        db = GroceryDB()
-        conn = db.get_connection()
-        cur = conn.cursor()
-
-        # Sample items for each store
-        sample_data = {
-            "costco_list": [
-                ("Bananas 3 lb", 2, "high"),
-                ("Organic Milk 1 gal", 1, "high"),
-                ("Bread Loaf", 1, "medium"),
-                ("Chicken Breast 5 lb", 1, "high"),
-                ("Apples 3 lb", 2, "medium"),
-            ],
-            "walmart_list": [
-                ("Eggs 12 count", 1, "high"),
-                ("Cheese Slices", 1, "medium"),
-                ("Greek Yogurt", 2, "medium"),
-                ("Cereal Box", 1, "low"),
-            ],
-            "cvs_list": [
-                ("Multivitamins", 1, "low"),
-                ("Shampoo", 1, "medium"),
-                ("Toothpaste", 1, "high"),
-            ],
-            "publix_list": [
-                ("Orange Juice", 1, "medium"),
-                ("Pasta", 2, "low"),
-                ("Tomato Sauce", 2, "low"),
-            ],
-        }
-
-        for table_name, items in sample_data.items():
-            # Check if table has any non-test data
-            cur.execute(f"SELECT COUNT(*) FROM {table_name} WHERE item_name NOT LIKE 'TEST_%'")
-            count = cur.fetchone()[0]
-
-            if count == 0:
-                logger.info(f"📝 Adding sample data to {table_name}")
-                for item_name, quantity, priority in items:
-                    cur.execute(
-                        f"""
-                        INSERT INTO {table_name} (item_name, quantity_needed, priority)
-                        VALUES (%s, %s, %s)
-                    """,
-                        (item_name, quantity, priority),
+        failed_tables = []
+
+        with db.connection() as conn, conn.cursor() as cur:
+            for table_name, items in _SAMPLE_DATA.items():
+                # A failure seeding one list shouldn't discard the lists already seeded
+                cur.execute("SAVEPOINT seed_list")
+                try:
+                    execute_values(
+                        cur, _SEED_LIST_SQL.format(table=sql.Identifier(table_name)), items
                     )
-            else:
-                logger.info(f"📊 {table_name} already has {count} items, skipping sample data")
+                    inserted = cur.rowcount
+                    cur.execute("RELEASE SAVEPOINT seed_list")
+                except psycopg2.Error as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT seed_list")
+                    logger.error("❌ Failed to add sample data to %s: %s", table_name, e)
+                    failed_tables.append(table_name)
+                    continue
+
+                if inserted > 0:
+                    logger.info("📝 Added %s sample items to %s", inserted, table_name)
+                else:
+                    logger.info("📊 %s already has items, skipping sample data", table_name)
+
+            conn.commit()
 
-        conn.commit()
-        cur.close()
-        conn.close()
+        if failed_tables:
+            logger.error("❌ Sample data not created for: %s", ", ".join(failed_tables))
+            return False
 
         logger.info("✅ Sample list data created successfully")
         return True
 
-    except Exception as e:
-        logger.error(f"❌ Failed to create sample data: {e}")
+    except Exception:
+        logger.exception("❌ Failed to create sample data")
         return False
 
 
 def show_usage_instructions():
     """Show usage instructions"""
-    logger.info("📖 USAGE INSTRUCTIONS")
-    logger.info("=" * 60)
-
-    script_dir = Path(__file__).parent.absolute()
-
-    logger.info("🔧 MANUAL EXECUTION:")
-    logger.info(f"   python {script_dir}/receipt_matcher.py")
-    logger.info(f"   python {script_dir}/receipt_matcher.py --hours 48")
-    logger.info(f"   python {script_dir}/receipt_matcher.py --dry-run")
-
-    logger.info("\n⏰ CRON JOB:")
-    logger.info("   Runs automatically every 30 minutes")
-    logger.info(f"   Logs: {script_dir}/logs/receipt_matcher_cron.log")
-    logger.info(f"   Status: {script_dir}/logs/last_run_status.json")
-
-    logger.info("\n🌐 HTTP API:")
-    logger.info(f"   python {script_dir}/receipt_matcher_api.py")
-    logger.info("   curl http://localhost:8080/health")
-    logger.info("   curl -X POST http://localhost:8080/match")
-    logger.info("   curl http://localhost:8080/status")
-
-    logger.info("\n🧪 TESTING:")
-    logger.info(f"   python {script_dir}/test_receipt_matcher.py")
-
-    logger.info("\n📋 LIST MANAGEMENT:")
-    logger.info("   Add items to store lists using database or future web interface")
-    logger.info("   Lists: costco_list, walmart_list, cvs_list, publix_list")
-
-    logger.info("\n📦 INVENTORY:")
-    logger.info("   View inventory table for purchased items")
-    logger.info("   Includes store, quantity, price, purchase date")
+    # One log record for the whole banner instead of one per line
+    lines = [
+        "📖 USAGE INSTRUCTIONS",
+        "=" * 60,
+        "🔧 MANUAL EXECUTION:",
+        f"   python {SERVICES_DIR}/receipt_matcher.py",
+        f"   python {SERVICES_DIR}/receipt_matcher.py --hours 48",
+        f"   python {SERVICES_DIR}/receipt_matcher.py --dry-run",
+        "\n⏰ CRON JOB:",
+        "   Runs automatically every 30 minutes",
+        f"   Logs: {SERVICES_DIR}/logs/receipt_matcher_cron.log",
+        f"   Status: {SERVICES_DIR}/logs/last_run_status.json",
+        "\n🌐 HTTP API:",
+        f"   python {PROJECT_DIR}/src/api/receipt_matcher_api.py",
+        "   curl http://localhost:8080/health",
+        "   curl -X POST http://localhost:8080/match",
+        "   curl http://localhost:8080/status",
+        "\n🧪 TESTING:",
+        f"   python {PROJECT_DIR}/tests/test_receipt_matcher.py",
+        "\n📋 LIST MANAGEMENT:",
+        "   Add items to store lists using database or future web interface",
+        "   Lists: costco_list, walmart_list, cvs_list, publix_list",
+        "\n📦 INVENTORY:",
+        "   View inventory table for purchased items",
+        "   Includes store, quantity, price, purchase date",
+    ]
+    logger.info("%s", "\n".join(lines))
+
+
+def _timed_step(step, *args):
+    """Run a setup step and log how long it took"""
+    start = time.perf_counter()
+    try:
+        return step(*args)
+    finally:
+        logger.info("⏱️ %s took %.2fs", step.__name__, time.perf_counter() - start)
 
 
 def main():
@@ -204,30 +271,47 @@ def main():
     success_count = 0
     total_steps = 5
 
-    # Step 1: Setup database tables
-    if setup_database_tables():
-        success_count += 1
+    from src.scripts.grocery_db import get_db
 
-    # Step 2: Create sample data
-    if create_sample_list_data():
-        success_count += 1
+    # One pooled GroceryDB for every database step instead of a connect per step
+    db = get_db()
+
+    # Step 1: Setup database tables; every other database step depends on it
+    if not _timed_step(setup_database_tables, db):
+        logger.error("❌ Aborting database-dependent steps")
+        db.close()
+        show_usage_instructions()
+        return 1
+    success_count += 1
 
-    # Step 3: Run tests
-    if run_tests():
-        success_count += 1
+    # The cron job only touches the filesystem, so install it while the database
+    # steps run; those stay in order because the test matcher reads every unchecked
+    # list item, including the sample data
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Step 4: Setup cron job
+        cron_future = executor.submit(_timed_step, setup_cron_job)
 
-    # Step 4: Setup cron job
-    if setup_cron_job():
-        success_count += 1
+        # Step 2: Create sample data
+        if _timed_step(create_sample_list_data, db):
+            success_count += 1
+
+        # Step 3: Run tests
+        if _timed_step(run_tests):
+            success_count += 1
+
+        if cron_future.result():
+            success_count += 1
 
     # Step 5: Show instructions
     show_usage_instructions()
     success_count += 1
 
+    db.close()
+
     # Final summary
     logger.info("📊 SETUP SUMMARY")
     logger.info("=" * 60)
-    logger.info(f"✅ Completed steps: {success_count}/{total_steps}")
+    logger.info("✅ Completed steps: %s/%s", success_count, total_steps)
 
     if success_count == total_steps:
         logger.info("🎉 RECEIPT MATCHER SETUP COMPLETED SUCCESSFULLY!")
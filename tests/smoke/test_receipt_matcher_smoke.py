@@ -38,7 +38,7 @@ class ReceiptMatcherSmokeTest:
 
     def __init__(self):
         self.db = GroceryDB()
-        self.matcher = ReceiptMatcher(lookback_hours=48)
+        self.matcher = ReceiptMatcher(lookback_hours=48, track_state=False)
         self.test_prefix = "SMOKE_TEST_"
         self.api_port = 8081  # Use different port for testing
         self.api_process = None
@@ -279,46 +279,37 @@ class ReceiptMatcherSmokeTest:
                 f"{self.test_prefix}TOOTHPASTE_TUBE",
                 f"{self.test_prefix}ORANGE_JUICE",  # Fuzzy match
             ]
-
-            for item_name in checked_items:
-                # Find which table this item is in
-                for store, table_name in self.matcher.list_tables.items():
-                    cur.execute(
-                        f"""
-                        SELECT is_checked FROM {table_name} 
-                        WHERE item_name = %s
-                    """,
-                        (item_name,),
-                    )
-
-                    result = cur.fetchone()
-                    if result:
-                        if result["is_checked"]:
-                            logger.info(f"✅ ITEM CORRECTLY CHECKED: {item_name}")
-                        else:
-                            logger.error(f"❌ ITEM NOT CHECKED: {item_name}")
-                            return False
-                        break
-
-            # Check that BREAD_LOAF was removed from lists
             removed_item = f"{self.test_prefix}BREAD_LOAF"
-            found_in_lists = False
 
-            for store, table_name in self.matcher.list_tables.items():
-                cur.execute(
-                    f"""
-                    SELECT COUNT(*) as count FROM {table_name} 
-                    WHERE item_name = %s
-                """,
-                    (removed_item,),
+            # Look up every item across all list tables at once and index the rows by
+            # item name (first table wins, in list_tables order)
+            cur.execute(
+                " UNION ALL ".join(
+                    f"SELECT {position} AS position, item_name, is_checked FROM {table_name} "
+                    "WHERE item_name = ANY(%(names)s)"
+                    for position, table_name in enumerate(self.matcher.list_tables.values())
                 )
+                + " ORDER BY position",
+                {"names": [*checked_items, removed_item]},
+            )
+            list_rows = {}
+            for row in cur.fetchall():
+                list_rows.setdefault(row["item_name"], row)
 
-                result = cur.fetchone()
-                if result["count"] > 0:
-                    found_in_lists = True
-                    break
+            verified = 0
+            for item_name in checked_items:
+                result = list_rows.get(item_name)
+                if result:
+                    if result["is_checked"]:
+                        logger.debug(f"✅ ITEM CORRECTLY CHECKED: {item_name}")
+                        verified += 1
+                    else:
+                        logger.error(f"❌ ITEM NOT CHECKED: {item_name}")
+                        return False
+            logger.info(f"✅ ITEMS CORRECTLY CHECKED: {verified}/{len(checked_items)}")
 
-            if found_in_lists:
+            # Check that BREAD_LOAF was removed from lists
+            if removed_item in list_rows:
                 logger.error(f"❌ ITEM NOT REMOVED: {removed_item}")
                 return False
             else:
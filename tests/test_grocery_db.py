@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Unit Tests for GroceryDB
+
+Tests for the connection pooling, prepared and batch insert paths, transactions
+and receipt parsing of grocery_db.py, run against mocked connections and cursors
+so no database is needed.
+"""
+
+import csv
+import io
+import os
+import sys
+import unittest
+from contextlib import contextmanager
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from psycopg2 import sql
+from psycopg2.extras import Json
+
+# Add project root to path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from src.scripts import grocery_db
+from src.scripts.grocery_db import (
+    _ITEM_PRICE_RE,
+    GroceryDB,
+    get_db,
+    parse_costco_receipt_format,
+)
+
+
+class TestGroceryDBPool(unittest.TestCase):
+    """Unit tests for the process-wide connection pools and get_db()"""
+
+    def setUp(self):
+        """Start from no pools, with pool creation mocked out"""
+        self.enterContext(patch.dict(grocery_db._POOLS, clear=True))
+        self.pool_class = self.enterContext(patch("src.scripts.grocery_db.ThreadedConnectionPool"))
+        self.pool_class.side_effect = lambda *args, **kwargs: MagicMock()
+        # Connect with the individual DB_* settings, not a DATABASE_URL from the shell
+        self.enterContext(patch.dict(os.environ, {"DB_NAME": "grocery_test", "DATABASE_URL": ""}))
+
+    def test_same_settings_share_one_pool(self):
+        """Test that GroceryDB instances with the same connect settings share a pool"""
+        first = GroceryDB()
+        second = GroceryDB()
+
+        self.assertIs(first._get_pool(), second._get_pool())
+        self.pool_class.assert_called_once()
+        self.assertEqual(self.pool_class.call_args.kwargs["database"], "grocery_test")
+
+    def test_different_settings_get_own_pool(self):
+        """Test that different connect settings don't share a pool"""
+        first = GroceryDB()
+        with patch.dict(os.environ, {"DB_NAME": "other_db"}):
+            second = GroceryDB()
+
+        self.assertIsNot(first._get_pool(), second._get_pool())
+        self.assertEqual(self.pool_class.call_count, 2)
+
+    def test_close_drops_shared_pool(self):
+        """Test that close() closes the shared pool and the next use creates a new one"""
+        db = GroceryDB()
+        pool = db._get_pool()
+
+        GroceryDB().close()
+
+        pool.closeall.assert_called_once()
+        self.assertIsNot(db._get_pool(), pool)
+
+    def test_get_db_returns_same_instance(self):
+        """Test that get_db() hands out one GroceryDB for the whole process"""
+        get_db.cache_clear()
+        self.addCleanup(get_db.cache_clear)
+
+        self.assertIs(get_db(), get_db())
+        # Constructing it doesn't connect; the pool is only made on first use
+        self.pool_class.assert_not_called()
+
+
+class TestGroceryDBBatchInsert(unittest.TestCase):
+    """Unit tests for the execute_values and COPY batch insert paths"""
+
+    def setUp(self):
+        """Hand every pooled connection request the same mock connection"""
+        self.db = GroceryDB()
+        self.conn = MagicMock()
+        self.cur = self.conn.cursor.return_value.__enter__.return_value
+
+        @contextmanager
+        def connection():
+            yield self.conn
+
+        self.enterContext(patch.object(self.db, "connection", connection))
+        self.execute_values = self.enterContext(patch("src.scripts.grocery_db.execute_values"))
+
+    def _purchases(self, count):
+        """Costco purchases with a JSON raw_data column"""
+        return [
+            {
+                "purchase_date": date(2025, 7, 1),
+                "item_name": f"ITEM {i}",
+                "item_price": 1.5,
+                "raw_data": {"line": i},
+            }
+            for i in range(count)
+        ]
+
+    def test_copy_value(self):
+        """Test how values are rendered for the COPY CSV stream"""
+        self.assertEqual(GroceryDB._copy_value(None), "\\N")
+        self.assertEqual(GroceryDB._copy_value(Json({"a": 1})), '{"a": 1}')
+        self.assertEqual(GroceryDB._copy_value("MILK"), "MILK")
+        self.assertEqual(GroceryDB._copy_value(2.5), 2.5)
+
+    def test_copy_rows_streams_csv(self):
+        """Test that _copy_rows writes one CSV line per row to COPY FROM STDIN"""
+        streamed = []
+        self.cur.copy_expert.side_effect = lambda query, buf: streamed.append(buf.read())
+
+        self.db._copy_rows(
+            self.cur,
+            "costco_purchases",
+            ("item_name", "item_price", "raw_data"),
+            [["MILK, 2%", 3.49, Json({"a": 1})], ["EGGS", None, None]],
+        )
+
+        self.cur.copy_expert.assert_called_once()
+        rows = list(csv.reader(io.StringIO(streamed[0])))
+        self.assertEqual(rows, [["MILK, 2%", "3.49", '{"a": 1}'], ["EGGS", "\\N", "\\N"]])
+
+    def test_small_batch_uses_execute_values(self):
+        """Test that batches up to COPY_THRESHOLD go through one execute_values call"""
+        purchases = self._purchases(3)
+        self.execute_values.return_value = [(1,), (2,), (3,)]
+
+        result = self.db.insert_costco_purchases_batch(purchases)
+
+        self.assertEqual(result, (3, 0))
+        self.execute_values.assert_called_once()
+        args, kwargs = self.execute_values.call_args
+        rows = args[2]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(rows[0]), len(GroceryDB.COSTCO_COLUMNS))
+        # raw_data is wrapped for JSONB adaptation without touching the caller's dict
+        self.assertIsInstance(rows[0][-1], Json)
+        self.assertEqual(purchases[0]["raw_data"], {"line": 0})
+        self.assertEqual(kwargs["page_size"], GroceryDB.COPY_THRESHOLD)
+        self.assertEqual(kwargs["template"].count("%s"), len(GroceryDB.COSTCO_COLUMNS))
+        self.assertTrue(kwargs["fetch"])
+        self.cur.copy_expert.assert_not_called()
+        self.conn.commit.assert_called_once()
+
+    def test_large_batch_uses_copy(self):
+        """Test that batches over COPY_THRESHOLD are streamed with COPY"""
+        purchases = self._purchases(GroceryDB.COPY_THRESHOLD + 1)
+
+        with patch.object(self.db, "_copy_rows") as copy_rows:
+            result = self.db.insert_costco_purchases_batch(purchases)
+
+        self.assertEqual(result, (len(purchases), 0))
+        copy_rows.assert_called_once()
+        self.assertEqual(len(copy_rows.call_args.args[3]), len(purchases))
+        self.execute_values.assert_not_called()
+        self.conn.commit.assert_called_once()
+
+    def test_failed_batch_falls_back_to_single_rows(self):
+        """Test that a rejected batch is retried row by row"""
+        purchases = self._purchases(3)
+        self.execute_values.side_effect = Exception("bad row")
+
+        with patch.object(self.db, "insert_costco_purchase", side_effect=[1, None, 3]) as insert:
+            result = self.db.insert_costco_purchases_batch(purchases)
+
+        self.assertEqual(result, (2, 1))
+        self.assertEqual(insert.call_count, 3)
+        self.conn.rollback.assert_called_once()
+
+    def test_empty_batch(self):
+        """Test that an empty batch doesn't touch the database"""
+        self.assertEqual(self.db.insert_costco_purchases_batch([]), (0, 0))
+        self.conn.cursor.assert_not_called()
+
+
+class TestGroceryDBPreparedInserts(unittest.TestCase):
+    """Unit tests for preparing the single-row INSERT statements"""
+
+    def setUp(self):
+        """Mock connection and cursor for one pooled connection"""
+        self.db = GroceryDB()
+        self.conn = MagicMock()
+        self.cur = MagicMock()
+
+    def test_only_own_statements_deallocated(self):
+        """Test that leftover statements of ours are dropped and nothing else is"""
+        self.cur.fetchall.return_value = [("costco_insert",)]
+
+        self.db._prepare_inserts(self.conn, self.cur)
+
+        lookup = self.cur.execute.call_args_list[0]
+        self.assertIn("pg_prepared_statements", lookup.args[0])
+        self.assertEqual(lookup.args[1], (list(GroceryDB.PREPARED_INSERTS),))
+        statements = [c.args[0] for c in self.cur.execute.call_args_list[1:]]
+        self.assertEqual(
+            statements[0], sql.SQL("DEALLOCATE {}").format(sql.Identifier("costco_insert"))
+        )
+        self.assertNotIn("DEALLOCATE ALL", statements)
+        # One PREPARE per statement after the cleanup
+        self.assertEqual(len(statements), 1 + len(GroceryDB.PREPARED_INSERTS))
+
+    def test_prepared_once_per_connection(self):
+        """Test that a connection that already has the statements isn't touched again"""
+        self.cur.fetchall.return_value = []
+        self.db._prepare_inserts(self.conn, self.cur)
+        self.cur.reset_mock()
+
+        self.db._prepare_inserts(self.conn, self.cur)
+
+        self.cur.execute.assert_not_called()
+
+
+class TestCostcoReceiptParsing(unittest.TestCase):
+    """Unit tests for the Costco receipt text parser"""
+
+    def test_item_price_pattern_matches_digit_check(self):
+        """Test that _ITEM_PRICE_RE accepts exactly what the old isdigit() check did"""
+        for value in ["9.99", "10", ".99", "9.", "1.2.3", "", ".", "..", "-1.00", "9.99N", "1,99"]:
+            with self.subTest(value=value):
+                self.assertEqual(
+                    bool(_ITEM_PRICE_RE.fullmatch(value)), value.replace(".", "").isdigit()
+                )
+
+    def test_item_prices_parsed(self):
+        """Test that item lines get their price, or 0.0 when it isn't numeric"""
+        receipt = "\n".join(
+            [
+                "E\t1751772\tDOTS PRETZEL\t9.99\tN",
+                "E\t512515\tKS WATER\t.99\tY",
+                "E\t96716\tCOUPON\t-3.00",
+            ]
+        )
+
+        items = parse_costco_receipt_format(receipt)["items"]
+
+        self.assertEqual([item["item_price"] for item in items], [9.99, 0.99, 0.0])
+        self.assertEqual(items[1]["tax_indicator"], "Y")
+
+
+class TestGroceryDBTransaction(unittest.TestCase):
+    """Unit tests for grouping single-row inserts with transaction()"""
+
+    def setUp(self):
+        """Hand out a fresh mock connection per pooled connection request"""
+        self.db = GroceryDB()
+        self.conns = []
+
+        @contextmanager
+        def connection():
+            conn = MagicMock()
+            self.conns.append(conn)
+            yield conn
+
+        self.enterContext(patch.object(self.db, "connection", connection))
+
+    def _executed(self, conn):
+        """SQL strings run on a connection's cursors"""
+        cur = conn.cursor.return_value.__enter__.return_value
+        return [c.args[0] for c in cur.execute.call_args_list if isinstance(c.args[0], str)]
+
+    def test_inserts_share_one_commit(self):
+        """Test that inserts in the block share its connection and commit once at the end"""
+        with self.db.transaction() as conn:
+            self.db.insert_costco_purchase({"item_name": "MILK"})
+            self.db.insert_costco_purchase({"item_name": "EGGS"})
+            conn.commit.assert_not_called()
+
+        self.assertEqual(len(self.conns), 1)
+        conn.commit.assert_called_once()
+        executed = self._executed(conn)
+        self.assertEqual(executed.count("SAVEPOINT purchase_insert"), 2)
+        self.assertEqual(executed.count("RELEASE SAVEPOINT purchase_insert"), 2)
+
+    def test_failed_row_rolls_back_to_savepoint(self):
+        """Test that a bad row only loses its own savepoint"""
+        with self.db.transaction() as conn:
+            cur = conn.cursor.return_value.__enter__.return_value
+            cur.fetchone.side_effect = [Exception("bad row"), (2,)]
+            self.assertIsNone(self.db.insert_costco_purchase({"item_name": "BAD"}))
+            self.assertEqual(self.db.insert_costco_purchase({"item_name": "EGGS"}), 2)
+
+        self.assertIn("ROLLBACK TO SAVEPOINT purchase_insert", self._executed(conn))
+        conn.rollback.assert_not_called()
+        conn.commit.assert_called_once()
+
+    def test_exception_rolls_back(self):
+        """Test that an error escaping the block rolls back and is re-raised"""
+        with self.assertRaises(ValueError), self.db.transaction() as conn:
+            raise ValueError("boom")
+
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+        # Later inserts get their own connection again
+        self.assertIsNone(getattr(self.db._local, "conn", None))
+
+    def test_nested_blocks_join_outer_transaction(self):
+        """Test that a nested block reuses the outer connection and doesn't commit"""
+        with self.db.transaction() as outer:
+            with self.db.transaction() as inner:
+                self.assertIs(inner, outer)
+            outer.commit.assert_not_called()
+
+        self.assertEqual(len(self.conns), 1)
+        outer.commit.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
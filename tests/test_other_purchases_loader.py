@@ -31,8 +31,8 @@ class TestOtherPurchasesLoader(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures"""
-        # Create temporary directory for test files
-        self.test_dir = tempfile.mkdtemp()
+        # Create temporary directory for test files (removed even if setUp fails)
+        self.test_dir = self.enterContext(tempfile.TemporaryDirectory())
         self.loader = OtherPurchasesLoader(data_dir=self.test_dir)
 
         # Sample valid YAML data
@@ -44,13 +44,6 @@ class TestOtherPurchasesLoader(unittest.TestCase):
             ],
         }
 
-    def tearDown(self):
-        """Clean up test fixtures"""
-        # Clean up temporary directory
-        import shutil
-
-        shutil.rmtree(self.test_dir, ignore_errors=True)
-
     def test_initialization(self):
         """Test OtherPurchasesLoader initialization"""
         loader = OtherPurchasesLoader(data_dir="./test_data")
@@ -227,15 +220,70 @@ class TestOtherPurchasesLoader(unittest.TestCase):
             self.assertIn(filename, returned_filenames)
 
 
+class TestOtherPurchasesLoaderUpsert(unittest.TestCase):
+    """Unit tests for batching purchase rows into the upsert"""
+
+    def setUp(self):
+        """Set up a loader without touching the database"""
+        self.enterContext(patch.object(OtherPurchasesLoader, "_ensure_tables_exist"))
+        self.loader = OtherPurchasesLoader(
+            data_dir=self.enterContext(tempfile.TemporaryDirectory())
+        )
+        self.execute_values = self.enterContext(
+            patch("src.loaders.other_purchases_loader.execute_values")
+        )
+
+    def _rows(self, items):
+        return [
+            self.loader._purchase_row(item, "Test Store", date(2025, 7, 10), time(14, 30), "{}")
+            for item in items
+        ]
+
+    def test_repeated_items_keep_last_occurrence(self):
+        """Test that an item repeated in one file is sent once, with its last values"""
+        rows = self._rows(
+            [
+                {"item_name": "Milk", "variant": "whole", "quantity": 1, "price": 3.49},
+                {"item_name": "Bread", "variant": "wheat", "quantity": 1},
+                {"item_name": "Milk", "variant": "whole", "quantity": 2, "price": 6.98},
+                {"item_name": "Milk", "variant": "skim", "quantity": 1},
+            ]
+        )
+
+        # Every row in the file is counted, even the ones folded together
+        self.assertEqual(self.loader._upsert_purchase_items(Mock(), rows), 4)
+
+        sent = self.execute_values.call_args.args[2]
+        self.assertEqual(sent, [rows[1], rows[2], rows[3]])
+        self.assertEqual(self.execute_values.call_args.kwargs["page_size"], 1000)
+
+    def test_items_without_variant_are_all_kept(self):
+        """Test that NULL-variant rows, which never conflict, are not deduplicated"""
+        rows = self._rows([{"item_name": "Apples"}, {"item_name": "Apples"}])
+
+        self.loader._upsert_purchase_items(Mock(), rows)
+
+        self.assertEqual(self.execute_values.call_args.args[2], rows)
+
+
 class TestOtherPurchasesLoaderIntegration(unittest.TestCase):
     """Integration tests that require database connection"""
 
+    @classmethod
+    def setUpClass(cls):
+        """Set up the loader and a database connection shared by every test"""
+        # Create temporary directory for test files (removed even if setUpClass fails)
+        cls.test_dir = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.loader = OtherPurchasesLoader(data_dir=cls.test_dir)
+        cls.conn = cls.loader.db.get_connection()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Close the shared connection"""
+        cls.conn.close()
+
     def setUp(self):
         """Set up test fixtures"""
-        # Create temporary directory for test files
-        self.test_dir = tempfile.mkdtemp()
-        self.loader = OtherPurchasesLoader(data_dir=self.test_dir)
-
         # Sample test data
         self.test_yaml_data = {
             "store_name": "Integration Test Store",
@@ -256,39 +304,29 @@ class TestOtherPurchasesLoaderIntegration(unittest.TestCase):
         """Clean up test fixtures"""
         # Clean up test data from database
         try:
-            conn = self.loader.db.get_connection()
-            cur = conn.cursor()
-            cur.execute("DELETE FROM other_purchases WHERE store_name LIKE '%Test%'")
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM other_purchases WHERE store_name = %s",
+                    (self.test_yaml_data["store_name"],),
+                )
+            self.conn.commit()
         except:
-            pass
-
-        # Clean up temporary directory
-        import shutil
-
-        shutil.rmtree(self.test_dir, ignore_errors=True)
+            self.conn.rollback()
 
     def test_database_table_creation(self):
         """Test that database tables are created properly"""
         try:
-            conn = self.loader.db.get_connection()
-            cur = conn.cursor()
-
-            # Check if other_purchases table exists
-            cur.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'other_purchases'
-                )
-            """)
-
-            table_exists = cur.fetchone()[0]
-            self.assertTrue(table_exists)
-
-            cur.close()
-            conn.close()
+            with self.conn.cursor() as cur:
+                # Check if other_purchases table exists
+                cur.execute("""
+                    SELECT EXISTS (
+                        SELECT FROM information_schema.tables 
+                        WHERE table_name = 'other_purchases'
+                    )
+                """)
+
+                table_exists = cur.fetchone()[0]
+                self.assertTrue(table_exists)
 
         except Exception as e:
             self.fail(f"Database table creation test failed: {e}")
@@ -306,13 +344,13 @@ class TestOtherPurchasesLoaderIntegration(unittest.TestCase):
         self.assertTrue(success)
 
         # Verify data was inserted into database
-        conn = self.loader.db.get_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur = self.conn.cursor(cursor_factory=RealDictCursor)
 
         try:
             cur.execute(
                 """
-                SELECT * FROM other_purchases 
+                SELECT store_name, item_name, variant, quantity, price
+                FROM other_purchases
                 WHERE store_name = %s AND item_name = %s
             """,
                 ("Integration Test Store", "Integration Test Item"),
@@ -330,7 +368,8 @@ class TestOtherPurchasesLoaderIntegration(unittest.TestCase):
 
         finally:
             cur.close()
-            conn.close()
+            # End the read transaction so later tests see fresh data
+            self.conn.rollback()
 
 
 def run_other_purchases_tests():
@@ -344,6 +383,7 @@ def run_other_purchases_tests():
 
     # Add test classes
     suite.addTests(loader.loadTestsFromTestCase(TestOtherPurchasesLoader))
+    suite.addTests(loader.loadTestsFromTestCase(TestOtherPurchasesLoaderUpsert))
     suite.addTests(loader.loadTestsFromTestCase(TestOtherPurchasesLoaderIntegration))
 
     # Run tests
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Unit Tests for Publix List Scraper
+
+Tests for the request pacing, page-size fallback, date parsing and file saving
+of the publix_list_scraper.py module, with the HTTP session and clock mocked out.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+import orjson
+
+# Add project root to path
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from src.scrapers.publix_list_scraper import PublixListScraper, RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Unit tests for the RateLimiter token bucket"""
+
+    def setUp(self):
+        """Drive the limiter from a fake clock"""
+        self.now = 100.0
+        self.sleep = self.enterContext(patch("src.scrapers.publix_list_scraper.time.sleep"))
+        self.enterContext(
+            patch("src.scrapers.publix_list_scraper.time.monotonic", side_effect=lambda: self.now)
+        )
+
+    def test_burst_passes_without_sleeping(self):
+        """Test that requests within the burst don't wait"""
+        limiter = RateLimiter(requests_per_second=5, burst=3)
+
+        for _ in range(3):
+            limiter.acquire()
+
+        self.sleep.assert_not_called()
+
+    def test_waits_for_next_token(self):
+        """Test that a request beyond the burst sleeps until a token refills"""
+        limiter = RateLimiter(requests_per_second=5, burst=1)
+
+        limiter.acquire()
+        limiter.acquire()
+
+        self.sleep.assert_called_once()
+        self.assertAlmostEqual(self.sleep.call_args.args[0], 0.2)
+
+    def test_refills_over_time(self):
+        """Test that elapsed time refills tokens up to the burst size"""
+        limiter = RateLimiter(requests_per_second=5, burst=2)
+        limiter.acquire()
+        limiter.acquire()
+
+        # Long enough to refill far more than the bucket holds
+        self.now += 10
+        limiter.acquire()
+        limiter.acquire()
+
+        self.sleep.assert_not_called()
+        self.assertEqual(limiter.tokens, 0)
+
+
+class TestPublixListScraper(unittest.TestCase):
+    """Unit tests for PublixListScraper page fetching and date parsing"""
+
+    def setUp(self):
+        """Build a scraper without its token setup, directories or thread pools"""
+        self.scraper = PublixListScraper.__new__(PublixListScraper)
+        self.scraper.base_url = "https://example.invalid/purchaseslist"
+        self.scraper.items_per_page = 500
+        self.scraper.min_items_per_page = 100
+        self.scraper.rate = Mock()
+        self.scraper.session = Mock()
+
+    def _response(self, status_code, data=None):
+        """Mock HTTP response carrying data as a JSON body"""
+        return Mock(status_code=status_code, content=orjson.dumps(data or {}))
+
+    def test_parse_purchase_date_slices_day(self):
+        """Test that the day is taken straight from the ISO timestamp"""
+        self.assertEqual(self.scraper.parse_purchase_date("2025-06-25T21:54:04"), "2025-06-25")
+        self.assertEqual(self.scraper.parse_purchase_date("2025-06-25"), "2025-06-25")
+
+    def test_parse_purchase_date_invalid(self):
+        """Test that missing and malformed dates fall back to unknown-date"""
+        for value in (None, "", "06/25/2025", "2025-6-25"):
+            with self.subTest(value=value), self.assertLogs(level="WARNING"):
+                self.assertEqual(self.scraper.parse_purchase_date(value), "unknown-date")
+
+    def test_first_page_halves_rejected_page_size(self):
+        """Test that a rejected first page is retried at half the size"""
+        data = {"PurchasesList": [{"PurchaseDate": "2025-06-25T21:54:04"}], "TotalPages": 4}
+        self.scraper.session.get.side_effect = [
+            self._response(413),
+            self._response(400),
+            self._response(200, data),
+        ]
+
+        self.assertEqual(self.scraper.get_purchases_page(1), data)
+
+        page_sizes = [
+            c.kwargs["params"]["itemsPerPage"] for c in self.scraper.session.get.call_args_list
+        ]
+        self.assertEqual(page_sizes, [500, 250, 125])
+        # The accepted size is kept for the remaining pages
+        self.assertEqual(self.scraper.items_per_page, 125)
+
+    def test_page_size_not_halved_below_minimum(self):
+        """Test that halving stops at the minimum page size"""
+        self.scraper.items_per_page = 150
+        self.scraper.session.get.return_value = self._response(413)
+
+        self.assertIsNone(self.scraper.get_purchases_page(1))
+        self.scraper.session.get.assert_called_once()
+        self.assertEqual(self.scraper.items_per_page, 150)
+
+    def test_later_page_not_halved(self):
+        """Test that only the first page triggers the page-size fallback"""
+        self.scraper.session.get.return_value = self._response(413)
+
+        self.assertIsNone(self.scraper.get_purchases_page(2))
+        self.scraper.session.get.assert_called_once()
+
+    def test_save_purchase_file_handles_short_writes(self):
+        """Test that a purchase file is written in full even when os.write is short"""
+        self.scraper.raw_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.scraper._existing = set()
+        purchase = {"PurchaseDate": "2025-06-25T21:54:04", "StoreName": "Publix 583"}
+        real_write = os.write
+
+        # Write at most 16 bytes per call
+        with patch(
+            "src.scrapers.publix_list_scraper.os.write",
+            side_effect=lambda fd, data: real_write(fd, data[:16]),
+        ):
+            self.assertTrue(self.scraper.save_purchase_file(purchase))
+
+        # Only the renamed file is left; no temp file behind
+        self.assertEqual(os.listdir(self.scraper.raw_dir), ["2025-06-25_publix-583_0.00.json"])
+        path = os.path.join(self.scraper.raw_dir, "2025-06-25_publix-583_0.00.json")
+        with open(path, "rb") as f:
+            self.assertEqual(orjson.loads(f.read())["purchase"], purchase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -31,7 +31,8 @@ class ReceiptMatcherTester:
 
     def __init__(self):
         self.db = GroceryDB()
-        self.matcher = ReceiptMatcher(lookback_hours=48)  # Look back 48 hours for testing
+        # Look back 48 hours for testing, without moving the production watermarks
+        self.matcher = ReceiptMatcher(lookback_hours=48, track_state=False)
 
     def setup_test_data(self):
         """Create test data for validation"""
@@ -18,6 +18,7 @@ from datetime import datetime, timedelta
 from unittest.mock import Mock, patch, MagicMock
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from rapidfuzz import process
 
 # Add project root to path
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
@@ -116,27 +117,49 @@ class TestReceiptMatcherUnit(unittest.TestCase):
         # Mock database connection and cursor
         mock_db = Mock()
         mock_conn = Mock()
-        mock_cur = Mock()
+        mock_cur = MagicMock()
 
         mock_db_class.return_value = mock_db
         mock_db.get_connection.return_value = mock_conn
         mock_conn.cursor.return_value = mock_cur
 
-        # Mock query results
-        mock_cur.fetchall.return_value = [
-            {
-                "item_name": "Test Item",
-                "purchase_date": datetime.now().date(),
-                "purchase_time": datetime.now().time(),
-                "item_quantity": 1,
-                "item_price": 5.99,
-                "raw_data": {"test": "data"},
-            }
-        ]
+        # Mock query results, streamed by iterating the server-side cursor
+        purchased_at = datetime.now().replace(microsecond=0)
+        mock_cur.__iter__.return_value = iter(
+            [
+                {
+                    "store": "costco",
+                    "table_source": "costco_purchases",
+                    "item_name": " Test Item ",
+                    "purchase_date": purchased_at.date(),
+                    "purchase_time": purchased_at.time(),
+                    "item_quantity": 1,
+                    "item_price": 5.99,
+                    "raw_data": {"test": "data"},
+                    "created_at": purchased_at,
+                }
+            ]
+        )
 
         matcher = ReceiptMatcher(lookback_hours=24)
         purchases = matcher.get_recent_purchases()
 
+        self.assertEqual(
+            purchases,
+            [
+                PurchaseItem(
+                    item_name="Test Item",
+                    store="costco",
+                    purchase_date=purchased_at,
+                    quantity=1,
+                    price=5.99,
+                    table_source="costco_purchases",
+                    raw_data={"test": "data"},
+                )
+            ],
+        )
+        self.assertEqual(purchases[0].ingested_at, purchased_at)
+
         # Verify database calls
         mock_db.get_connection.assert_called_once()
         mock_conn.cursor.assert_called_once()
@@ -388,6 +411,117 @@ class TestReceiptMatcherEdgeCases(unittest.TestCase):
         self.assertGreater(similarity, 0.5)
 
 
+class TestReceiptMatcherFuzzyMatching(unittest.TestCase):
+    """Tests for the exact-match fast path and batched fuzzy scoring"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.matcher = ReceiptMatcher(lookback_hours=24)
+
+    def _purchase(self, item_name, store="costco"):
+        return PurchaseItem(
+            item_name=item_name,
+            store=store,
+            purchase_date=datetime.now(),
+            quantity=1,
+            price=1.0,
+            table_source=f"{store}_purchases",
+            raw_data={},
+        )
+
+    def _list_item(self, item_id, item_name, store="costco"):
+        return ListItem(
+            id=item_id,
+            item_name=item_name,
+            store=store,
+            is_checked=False,
+            table_source=f"{store}_list",
+        )
+
+    def test_exact_match_skips_fuzzy_scoring(self):
+        """Test that exact normalized names are matched without fuzzy scoring"""
+        list_items = [
+            self._list_item(1, "Bananas", store="walmart"),
+            self._list_item(2, "bananas", store="costco"),
+            self._list_item(3, "Whole Milk"),
+        ]
+        purchases = [self._purchase("  BANANAS "), self._purchase("Whole Milks")]
+
+        with patch.object(
+            self.matcher, "_best_fuzzy_matches", wraps=self.matcher._best_fuzzy_matches
+        ) as fuzzy:
+            matches = self.matcher.find_matches(purchases, list_items)
+
+        # Only the name without an exact match is fuzzy scored
+        self.assertEqual(fuzzy.call_args.args[0], ["whole milks"])
+        # The purchase store's own list wins among exact matches
+        self.assertEqual(matches[0].list_item.id, 2)
+        self.assertEqual(matches[0].match_score, 1.0)
+        self.assertEqual(matches[0].action, "mark_checked")
+        self.assertEqual(matches[1].list_item.id, 3)
+        self.assertLess(matches[1].match_score, 1.0)
+
+    def test_fuzzy_scoring_is_chunked(self):
+        """Test that purchase names are scored SCORE_CHUNK_SIZE rows at a time"""
+        list_items = [
+            self._list_item(1, "organic bananas"),
+            self._list_item(2, "whole milk"),
+            self._list_item(3, "cheddar cheese"),
+        ]
+        names = ["organic banana", "whole milks", "cheddar chees", "dish soap", "whole milk 1"]
+        candidate_names = [item.norm_name for item in list_items]
+
+        unchunked = self.matcher._best_fuzzy_matches(names, list_items, candidate_names)
+
+        self.matcher.SCORE_CHUNK_SIZE = 2
+        with patch("src.services.receipt_matcher.process.cdist", wraps=process.cdist) as cdist:
+            chunked = self.matcher._best_fuzzy_matches(names, list_items, candidate_names)
+
+        self.assertEqual([len(c.args[0]) for c in cdist.call_args_list], [2, 2, 1])
+        self.assertEqual(chunked, unchunked)
+        self.assertEqual(chunked["organic banana"][0].id, 1)
+        self.assertEqual(chunked["whole milk 1"][0].id, 2)
+        # Below-threshold names get no match
+        self.assertNotIn("dish soap", chunked)
+
+    def test_trigram_index_selects_candidates(self):
+        """Test that large lists only score candidates sharing a distinctive trigram"""
+        products = (
+            "bananas whole-milk cheddar eggs bread butter yogurt apples oranges spinach "
+            "carrots onions garlic rice pasta coffee tea honey salmon chicken"
+        ).split()
+        list_items = [self._list_item(i, f"kirkland {name}") for i, name in enumerate(products)]
+        candidate_names = [item.norm_name for item in list_items]
+        self.matcher.CANDIDATE_INDEX_MIN_ITEMS = 10
+
+        index = self.matcher._build_candidate_index(candidate_names)
+        # Trigrams shared by every name (the brand) carry no signal and are dropped
+        self.assertNotIn("kir", index)
+        self.assertEqual(index["ban"], [0])
+
+        names = ["kirkland banana", "kirkland whole-milks", "kirkland"]
+        with patch(
+            "src.services.receipt_matcher.process.extractOne", wraps=process.extractOne
+        ) as extract_one:
+            indexed = self.matcher._best_fuzzy_matches(names, list_items, candidate_names)
+
+        scored = {c.args[0]: c.args[1] for c in extract_one.call_args_list}
+        self.assertIn("kirkland bananas", scored["kirkland banana"])
+        self.assertLess(len(scored["kirkland banana"]), len(candidate_names))
+        self.assertIn("kirkland whole-milk", scored["kirkland whole-milks"])
+        # A name with no distinctive trigram falls back to every candidate
+        self.assertEqual(scored["kirkland"], candidate_names)
+
+        # Same best matches as scoring every candidate (cdist scores are float32)
+        self.matcher.CANDIDATE_INDEX_MIN_ITEMS = len(candidate_names) + 1
+        brute_force = self.matcher._best_fuzzy_matches(names, list_items, candidate_names)
+        self.assertEqual(indexed.keys(), brute_force.keys())
+        for name, (list_item, score) in indexed.items():
+            self.assertEqual(list_item, brute_force[name][0])
+            self.assertAlmostEqual(score, brute_force[name][1], places=5)
+        self.assertEqual(indexed["kirkland banana"][0].id, 0)
+
+
 def run_unit_tests():
     """Run all unit tests"""
     print("🧪 STARTING RECEIPT MATCHER UNIT TESTS")
@@ -401,6 +535,7 @@ def run_unit_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestReceiptMatcherUnit))
     suite.addTests(loader.loadTestsFromTestCase(TestReceiptMatcherIntegration))
     suite.addTests(loader.loadTestsFromTestCase(TestReceiptMatcherEdgeCases))
+    suite.addTests(loader.loadTestsFromTestCase(TestReceiptMatcherFuzzyMatching))
 
     # Run tests
     runner = unittest.TextTestRunner(verbosity=2)